@@ -0,0 +1,263 @@
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+
+from PIL import Image
+
+from structures.definitions import CLASSES, REL_CLASSES
+from utils.cache import image_key, checkpoint_key
+from utils.profiler import profiler
+
+RELTR_PATH = "RelTR"
+CHECKPOINT = "ckpt/checkpoint0149.pth"
+
+
+class SceneGraphGenerator:
+    """
+        Keeps a single RelTR model in memory and creates scene graphs for frames / images.
+        The model is loaded on first use, so graphene runs that never call RelTR do not need torch.
+    """
+
+    def __init__(self, reltr_path=RELTR_PATH, device="cuda", topk=32, checkpoint=None, threshold=0.3, cache=None):
+        self.reltr_path = reltr_path
+        self.device = device
+        self.topk = topk
+        self.threshold = threshold
+        if checkpoint is None:
+            checkpoint = os.path.join(reltr_path, CHECKPOINT)
+        self.checkpoint = checkpoint
+        self.cache = cache  # Optional SceneGraphCache, frames found in it are not passed to RelTR
+        self.model_key = checkpoint_key(checkpoint, topk, threshold)
+        self.model = None
+        self.transform = None
+
+    def load(self):
+        """
+        Builds RelTR and loads the checkpoint. Does nothing if the model is already loaded
+        """
+        if self.model is not None:
+            return
+        import torch
+        import torchvision.transforms as T
+
+        # RelTR is not a package, its modules (models, util, main) are imported from the submodule root
+        reltr_root = os.path.abspath(self.reltr_path)
+        if reltr_root not in sys.path:
+            sys.path.insert(0, reltr_root)
+        from main import get_args_parser
+        from models import build_model
+
+        args = get_args_parser().parse_args(["--device", self.device, "--resume", self.checkpoint])
+        model, _, _ = build_model(args)
+        ckpt = torch.load(self.checkpoint, map_location=self.device)
+        model.load_state_dict(ckpt["model"])
+        model.to(self.device)
+        model.eval()
+        self.model = model
+        self.transform = T.Compose([
+            T.Resize(800),
+            T.ToTensor(),
+            T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+
+    def predict(self, img_path):
+        """
+        Returns the scene graph of an image as list of triples in the RelTR JSON format
+        """
+        return self.predict_batch([img_path])[0]
+
+    def predict_batch(self, img_paths):
+        """
+        Runs all images in one forward pass and returns one list of triples per image.
+        Images of different sizes are padded and masked by RelTR (nested tensors)
+        """
+        import torch
+
+        self.load()
+        images = [Image.open(img_path).convert("RGB") for img_path in img_paths]
+        samples = [self.transform(im).to(self.device) for im in images]
+        with torch.no_grad():
+            outputs = self.model(samples)
+        return [self.to_triples(outputs, i, im.size) for i, im in enumerate(images)]
+
+    def generate(self, img_path, graph_path):
+        """
+        Creates scene graph from image and saves json output file in graph path
+        """
+        return self.generate_batch([img_path], [graph_path])[0]
+
+    def generate_batch(self, img_paths, graph_paths):
+        """
+        Creates scene graphs for a batch of images and saves one json output file per image in graph_paths
+        """
+        return list(self.generate_batches([(img_paths, graph_paths)]))[0]
+
+    def generate_batches(self, batches):
+        """
+        Creates scene graphs for a sequence of (img_paths, graph_paths) batches and yields the triples of each batch
+        in order. Images found in the cache are not passed to RelTR
+        """
+        pending = deque()  # Looked up batches whose missing images are being predicted
+
+        def missing_images():
+            # Looks up each batch only when the prediction of its missing images is requested
+            for img_paths, graph_paths in batches:
+                keys, batch_triples = self.lookup(img_paths)
+                missing = [img_path for img_path, triples in zip(img_paths, batch_triples) if triples is None]
+                pending.append((graph_paths, keys, batch_triples, missing))
+                yield missing
+
+        predicted = self.predict_batches(missing_images())
+        while True:
+            with profiler.timer("scene_graph_generation"):
+                batch_predicted = next(predicted, None)
+            if batch_predicted is None:
+                break
+            graph_paths, keys, batch_triples, missing = pending.popleft()
+            if missing:
+                profiler.count("frames_generated", len(missing))
+                batch_predicted = iter(batch_predicted)
+                for i, triples in enumerate(batch_triples):
+                    if triples is None:
+                        batch_triples[i] = next(batch_predicted)
+                        if self.cache is not None:
+                            self.cache.put(keys[i], batch_triples[i])
+            for triples, graph_path in zip(batch_triples, graph_paths):
+                export_triples(triples, graph_path)
+            yield batch_triples
+
+    def predict_batches(self, batches):
+        """
+        Yields the triples of each batch of image paths, an empty list for empty batches
+        """
+        for img_paths in batches:
+            yield self.predict_batch(img_paths) if img_paths else []
+
+    def close(self):
+        """
+        Releases the model, it is loaded again on the next call
+        """
+        self.model = None
+
+    def lookup(self, img_paths):
+        """
+        Returns the cache keys and the cached triples of the images, None for images that are not cached
+        """
+        if self.cache is None:
+            return [None] * len(img_paths), [None] * len(img_paths)
+        keys = [image_key(img_path, self.model_key) for img_path in img_paths]
+        return keys, [self.cache.get(key) for key in keys]
+
+    def to_triples(self, outputs, i, size):
+        """
+        Converts the raw RelTR output of the i-th image in a batch to triples, keeping the topk most confident
+        """
+        import torch
+
+        probas = outputs["rel_logits"].softmax(-1)[i, :, :-1]
+        probas_sub = outputs["sub_logits"].softmax(-1)[i, :, :-1]
+        probas_obj = outputs["obj_logits"].softmax(-1)[i, :, :-1]
+        keep = torch.logical_and(probas.max(-1).values > self.threshold,
+                                 torch.logical_and(probas_sub.max(-1).values > self.threshold,
+                                                   probas_obj.max(-1).values > self.threshold))
+        keep_queries = torch.nonzero(keep, as_tuple=True)[0]
+        confidence = probas[keep_queries].max(-1)[0] * probas_sub[keep_queries].max(-1)[0] * \
+                     probas_obj[keep_queries].max(-1)[0]
+        keep_queries = keep_queries[torch.argsort(-confidence)[:self.topk]]
+
+        sub_boxes = rescale_boxes(outputs["sub_boxes"][i, keep_queries], size).tolist()
+        obj_boxes = rescale_boxes(outputs["obj_boxes"][i, keep_queries], size).tolist()
+        triples = []
+        for q, sub_box, obj_box in zip(keep_queries.tolist(), sub_boxes, obj_boxes):
+            triples.append({
+                "subject": box_to_dict(CLASSES[probas_sub[q].argmax().item()], sub_box),
+                "predicate": {"id": REL_CLASSES[probas[q].argmax().item()]},
+                "object": box_to_dict(CLASSES[probas_obj[q].argmax().item()], obj_box)
+            })
+        return triples
+
+
+class SceneGraphGeneratorPool(SceneGraphGenerator):
+    """
+        Fans batches of frames out to a pool of worker processes that each hold their own RelTR model.
+        Results are returned in the order of the batches, the cache is only accessed from the main process.
+    """
+
+    def __init__(self, workers, reltr_path=RELTR_PATH, device="cuda", topk=32, checkpoint=None, threshold=0.3,
+                 cache=None):
+        super().__init__(reltr_path, device, topk, checkpoint, threshold, cache)
+        self.workers = workers
+        self.pool = None
+
+    def load(self):
+        """
+        Starts the worker processes, each of them loads RelTR once
+        """
+        if self.pool is not None:
+            return
+        settings = (self.reltr_path, self.device, self.topk, self.checkpoint, self.threshold)
+        self.pool = multiprocessing.Pool(self.workers, initializer=init_worker, initargs=settings)
+
+    def predict_batch(self, img_paths):
+        self.load()
+        return self.pool.apply(predict_in_worker, (img_paths,))
+
+    def predict_batches(self, batches):
+        """
+        Yields the triples of each batch of image paths in order. Batches are taken from the iterable only while fewer
+        than two per worker are in progress, so every worker has its next batch queued without reading ahead further
+        """
+        self.load()
+        results = deque()
+        for img_paths in batches:
+            results.append(self.pool.apply_async(predict_in_worker, (img_paths,)) if img_paths else None)
+            if len(results) >= 2 * self.workers:
+                result = results.popleft()
+                yield result.get() if result is not None else []
+        while results:
+            result = results.popleft()
+            yield result.get() if result is not None else []
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+_worker_generator = None
+
+
+def init_worker(*settings):
+    global _worker_generator
+    _worker_generator = SceneGraphGenerator(*settings)
+    _worker_generator.load()
+
+
+def predict_in_worker(img_paths):
+    return _worker_generator.predict_batch(img_paths)
+
+
+def rescale_boxes(boxes, size):
+    """
+    Converts relative (centre x, centre y, w, h) boxes to absolute (xmin, ymin, xmax, ymax) for an image of size (w, h)
+    """
+    import torch
+
+    img_w, img_h = size
+    x_c, y_c, w, h = boxes.cpu().unbind(-1)
+    b = torch.stack([x_c - 0.5 * w, y_c - 0.5 * h, x_c + 0.5 * w, y_c + 0.5 * h], dim=-1)
+    return b * torch.tensor([img_w, img_h, img_w, img_h], dtype=torch.float32)
+
+
+def box_to_dict(name, box):
+    return {"id": name, "xmin": box[0], "ymin": box[1], "xmax": box[2], "ymax": box[3]}
+
+
+@profiler.timed("export_triples")
+def export_triples(triples, graph_path):
+    with open(graph_path, "w") as file:
+        json.dump(triples, file)
+        file.close()
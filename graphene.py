@@ -1,11 +1,24 @@
 import os
-import subprocess
 import argparse
+import json
+import logging
+import multiprocessing
 import tqdm
+from collections import deque
 
 from structures.graph import *
 from utils import inout
 from cam import Camera
+from generator import SceneGraphGenerator, SceneGraphGeneratorPool, RELTR_PATH, export_triples
+from utils.cache import SceneGraphCache
+from utils.framefilter import DuplicateFrameFilter
+from utils.pipeline import Stage, QUEUE_SIZE
+from utils.profiler import profiler
+from structures.motion import MOTION_MODELS
+from streams import Stream, StreamScheduler, stream_names
+from structures.segments import build_segment, stitch
+from utils.sequences import open_sequence
+from utils.textexport import IncrementalTextExport, SYNC_EVERY
 
 TEMP_DIR = "temp"
 CAM_PATH = "cam"
@@ -16,13 +29,29 @@ class Graphene:
         Creates scene graphs on frames / images and can call temporal graph creation
     """
 
-    def __init__(self, alpha, min_assignment_conf):
+    def __init__(self, alpha, min_assignment_conf, device="cuda", topk=32, batch_size=1, cache=None, workers=1,
+                 skip_similar=None, max_inactive=None, compact=False, motion=None):
         self.temp_dir = TEMP_DIR
-        self.tg = TemporalGraph()
+        self.max_inactive = max_inactive
+        self.compact = compact
+        self.motion = motion
+        self.tg = self.create_temporal_graph()
         self.alpha = alpha
         self.min_assignment_conf = min_assignment_conf
+        self.batch_size = batch_size
+        self.skip_similar = skip_similar
+        # Frames that are near-duplicates of the last processed frame reuse its scene graph instead of calling RelTR
+        self.frame_filter = DuplicateFrameFilter(skip_similar) if skip_similar is not None else None
+        # RelTR is loaded once on the first frame (once per worker process) and then kept for all following frames
+        if workers > 1:
+            self.generator = SceneGraphGeneratorPool(workers, RELTR_PATH, device=device, topk=topk, cache=cache)
+        else:
+            self.generator = SceneGraphGenerator(RELTR_PATH, device=device, topk=topk, cache=cache)
 
-    def run_online(self, graph2text):
+    def create_temporal_graph(self):
+        return TemporalGraph(self.max_inactive, self.compact, MOTION_MODELS[self.motion]() if self.motion else None)
+
+    def run_online(self, graph2text, sync_every=SYNC_EVERY, resume=False):
         if os.path.isdir(self.temp_dir):
             os.rmdir(self.temp_dir)
         os.mkdir(self.temp_dir)
@@ -30,19 +59,30 @@ class Graphene:
         img_name = "img.png"
         scenegraph_name = "scenegraph.json"
 
+        # Each frame only appends its own section to the text export, readers can follow it with tail -f
+        export = IncrementalTextExport(os.path.join(OUT_DIR, graph2text), sync_every, resume) if graph2text else None
         cam = Camera(export_path=CAM_PATH)
-        frame_count = 0
-        while True:
-            cam.get_image(img_name)
-            generate_scene_graph("RelTR", os.path.join(CAM_PATH, img_name),
-                                 os.path.join(self.temp_dir, scenegraph_name))
-            frame_count += 1
-            fg = FrameGraph()
-            fg.create_graph(os.path.join(self.temp_dir, scenegraph_name))
-            self.tg.insert_framegraph(fg, self.alpha, self.min_assignment_conf)
-            if graph2text:
-                self.tg.to_text(os.path.join(OUT_DIR, graph2text))
-
+        frame_count = export.next_frame() if export else 0
+        edges = []  # Temporal graph edges of the last frame
+        try:
+            while True:
+                cam.get_image(img_name)
+                if self.frame_filter and self.frame_filter.is_duplicate(os.path.join(CAM_PATH, img_name)):
+                    profiler.count("frames_skipped")
+                    self.tg.repeat_frame(frame_count)
+                else:
+                    self.generator.generate(os.path.join(CAM_PATH, img_name),
+                                            os.path.join(self.temp_dir, scenegraph_name))
+                    fg = FrameGraph(frame_count)
+                    fg.create_graph(os.path.join(self.temp_dir, scenegraph_name))
+                    f2t = self.tg.insert_framegraph(fg, self.alpha, self.min_assignment_conf)
+                    edges = [(f2t[n1], f2t[n2]) for n1, n2 in fg.g.edges]
+                if export:
+                    export.append(frame_count, self.tg.frame_stories(frame_count, edges))
+                frame_count += 1
+        finally:
+            if export:
+                export.close()
 
     def classify_images(self, image_path):
         """
@@ -54,11 +94,7 @@ class Graphene:
 
         images = sorted(os.listdir(image_path))
         images = inout.clean_img_list(images)
-        image_count = 0
-        for image in tqdm.tqdm(images):
-            generate_scene_graph("RelTR", image_path + "/" + image,
-                                 self.temp_dir + "/" + "%03d"%image_count + ".json")
-            image_count += 1
+        self.generate_scene_graphs(image_path, images)
     
     def classify_images_window(self, image_path, window_size):
         """
@@ -81,8 +117,7 @@ class Graphene:
         images = inout.clean_img_list(images)
 
         print("generating scene graphs:")
-        for image_count, image in enumerate( tqdm.tqdm(images)):
-            generate_scene_graph("RelTR", image_path + "/" + image,self.temp_dir + "/" + "%03d"%image_count + ".json")
+        self.generate_scene_graphs(image_path, images)
 
         tmp_graphs = sorted(os.listdir(self.temp_dir))
         tmp_graphs = inout.clean_json_list(tmp_graphs)
@@ -115,19 +150,148 @@ class Graphene:
         
         
 
+    def generate_scene_graphs(self, image_path, images):
+        """
+        Calls scene graph generator on batches of batch_size images, writes one graph per image to the temp directory
+        """
+        for _ in tqdm.tqdm(self.generate_frames(image_path, images), total=len(images)):
+            pass
+
+    def generate_frames(self, image_path, images):
+        """
+        Generates the scene graphs of all images and yields (triples, duplicate) in frame order.
+        Near-duplicate frames are not passed to the generator, they get a copy of the previous frame's graph.
+        Frames are checked for duplicates one by one as the generator asks for its next batch, so the first scene graph
+        does not wait for the whole folder to be hashed
+        """
+        decided = deque()  # (frame number, duplicate) of the frames checked so far that were not yielded yet
+        generated = (triples for batch_triples in self.generator.generate_batches(self.batches(image_path, images,
+                                                                                                decided))
+                     for triples in batch_triples)
+        triples = None
+        for frame_triples in generated:
+            # Frames are decided in order, the generated frame is the first frame in decided that is no duplicate
+            image_count, duplicate = decided.popleft()
+            while duplicate:
+                export_triples(triples, self.temp_dir + "/" + "%03d"%image_count + ".json")
+                yield triples, True
+                image_count, duplicate = decided.popleft()
+            triples = frame_triples
+            yield triples, False
+        for image_count, _ in decided:  # Trailing duplicates
+            export_triples(triples, self.temp_dir + "/" + "%03d"%image_count + ".json")
+            yield triples, True
+
+    def batches(self, image_path, images, decided):
+        """
+        Yields batches of (image paths, scene graph paths in the temp directory) of the images that are not
+        near-duplicates of the last processed image. Appends (frame number, duplicate) of every checked image to decided
+        """
+        if self.frame_filter is not None:
+            self.frame_filter.reset()
+        batch = []
+        skipped = 0
+        for image_count, image in enumerate(images):
+            duplicate = self.frame_filter is not None and self.frame_filter.is_duplicate(image_path + "/" + image)
+            decided.append((image_count, duplicate))
+            if duplicate:
+                profiler.count("frames_skipped")
+                skipped += 1
+                continue
+            batch.append((image_count, image))
+            if len(batch) == self.batch_size:
+                yield self.batch(image_path, batch)
+                batch = []
+        if batch:
+            yield self.batch(image_path, batch)
+        if self.frame_filter is not None:
+            print(f"Skipped {skipped} of {len(images)} frames as near-duplicates")
+
+    def batch(self, image_path, frames):
+        img_paths = [image_path + "/" + image for _, image in frames]
+        graph_paths = [self.temp_dir + "/" + "%03d"%image_count + ".json" for image_count, _ in frames]
+        return img_paths, graph_paths
+
+    def process_images(self, image_path, queue_size=QUEUE_SIZE):
+        """
+        Streams all frames in input folder through scene graph generation, temporal graph insertion and
+        export of images with graph overlays. The stages run concurrently and are connected by bounded queues,
+        the first annotated frame is written while later frames are still being generated
+        """
+        if os.path.isdir(self.temp_dir):
+            os.rmdir(self.temp_dir)
+        os.mkdir(self.temp_dir)
+        images = sorted(os.listdir(image_path))
+        images = inout.clean_img_list(images)
+        ann_path = os.path.join(image_path, "annotated")
+        if not os.path.isdir(ann_path):
+            os.mkdir(ann_path)
+
+        def insert(scene_graphs):
+            for sg_count, (triples, duplicate) in enumerate(scene_graphs):
+                if duplicate:
+                    self.tg.repeat_frame(sg_count)
+                else:
+                    fg = FrameGraph(sg_count)
+                    fg.create_graph_from_triples(triples)
+                    self.tg.insert_framegraph(fg, self.alpha, self.min_assignment_conf, verbose=True)
+                # Hand a snapshot to the exporter, the temporal graph keeps changing while it plots
+                yield sg_count, self.tg.frame_objects(sg_count)
+
+        scene_graphs = Stage(lambda: self.generate_frames(image_path, images), queue_size)
+        frames = Stage(lambda: insert(scene_graphs), queue_size)
+        # Plotting stays in the main thread as matplotlib is not thread-safe
+        for sg_count, objects in tqdm.tqdm(frames, total=len(images)):
+            plot_frame(os.path.join(image_path, images[sg_count]), os.path.join(ann_path, str(sg_count)), objects)
+
+    def process_streams(self, image_paths, graph2text=None, visual=None, text_runs=False):
+        """
+        Processes several image directories (e.g. one per camera) at once. Every stream has its own temporal graph and
+        writes its exports to its own directory in the output directory, the scene graph generator is shared and
+        batches frames of all streams round-robin
+        """
+        streams = []
+        for name, image_path in zip(stream_names(image_paths), image_paths):
+            frame_filter = DuplicateFrameFilter(self.skip_similar) if self.skip_similar is not None else None
+            streams.append(Stream(name, image_path, self.create_temporal_graph(), os.path.join(self.temp_dir, name),
+                                  os.path.join(OUT_DIR, name), frame_filter))
+        total = sum(len(stream.images) for stream in streams)
+        print(f"Processing {len(streams)} streams with {total} frames")
+        scheduler = StreamScheduler(streams, self.generator, self.batch_size)
+        with tqdm.tqdm(total=total) as progress:
+            for inserted in scheduler.run(self.alpha, self.min_assignment_conf):
+                progress.update(inserted)
+            for stream in streams:
+                progress.update(stream.finish(graph2text, visual, text_runs))
+        return streams
+
     def generate_temporal_graph(self, scenegraphs_path):
         """
-        For all scene graphs of individual frames, create frame graph and update temporal graph
+        For all scene graphs of individual frames, create frame graph and update temporal graph.
+        scenegraphs_path is a directory of JSON files or a columnar file (utils.sequences), read one frame at a time
         """
-        scene_graphs = sorted(os.listdir(scenegraphs_path))
-        scene_graphs = inout.clean_json_list(scene_graphs)
-        sg_count = 0
-        for sg in scene_graphs:
+        for sg_count, arrays in enumerate(open_sequence(scenegraphs_path)):
             fg = FrameGraph(sg_count)
-            fg.create_graph(scenegraphs_path + "/" + sg)
+            fg.create_graph_from_arrays(arrays)
             self.tg.insert_framegraph(fg, self.alpha, self.min_assignment_conf, verbose=True)
-            sg_count += 1
             
+    def generate_temporal_graph_segments(self, scenegraphs_path, segments):
+        """
+        Identical to generate_temporal_graph, but splits the scene graphs into contiguous segments whose temporal graphs
+        are built in parallel processes and then stitched by matching the nodes at each segment boundary
+        """
+        frames = len(open_sequence(scenegraphs_path))
+        if frames == 0 or segments >= frames:
+            # Segments of single frames only add stitching work
+            return self.generate_temporal_graph(scenegraphs_path)
+        size = -(-frames // segments)
+        tasks = [(scenegraphs_path, start, min(start + size, frames), self.alpha, self.min_assignment_conf,
+                  self.max_inactive, self.compact, self.motion) for start in range(0, frames, size)]
+        print(f"Building {len(tasks)} segments of up to {size} frames in parallel")
+        with multiprocessing.Pool(len(tasks)) as pool:
+            results = pool.starmap(build_segment, tasks)
+        self.tg = stitch(results, self.alpha, self.min_assignment_conf)
+
     def generate_temporal_graph_frames(self, scenegraphs_path, image_path):
         """
         Identical to generate_temporal_graph, but exports images with graph overlays
@@ -148,44 +312,63 @@ class Graphene:
             sg_count += 1
 
 
-def generate_scene_graph(reltr_path, img_path, graph_path, device="cuda", topk=32):
-    """
-    calls RelTR to create scene graph from image and saves json output file in graph path
-    """
-    subprocess.check_output([f'python',
-                             f"{reltr_path}/mkgraph.py",
-                             "--img_path", f"{img_path}",
-                             "--device", f"{device}",
-                             "--resume", f"{reltr_path}/ckpt/checkpoint0149.pth",
-                             "--export_path", f"{graph_path}",
-                             "--topk", f"{topk}"])
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
 
 
 def main(args):
-    graphene = Graphene(args.alpha, args.min_confidence)
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    logging.getLogger("PIL").setLevel(max(logging.INFO, logging.getLogger().level))  # PIL logs every image chunk
+    profiler.enabled = args.profile
+    cache = None
+    if args.cache_dir:
+        cache = SceneGraphCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    graphene = Graphene(args.alpha, args.min_confidence, args.device, args.topk, args.batch_size, cache,
+                        args.workers, args.skip_similar, args.max_inactive, args.compact, args.motion)
 
     if not os.path.isdir(OUT_DIR):
         os.mkdir(OUT_DIR)
     if args.cam:
-        graphene.run_online(args.text)
+        try:
+            graphene.run_online(args.text, args.text_sync, args.resume)
+        finally:
+            if cache:
+                cache.close()
         return
     if args.img_path_window:
         graphene.classify_images_window(args.img_path_window, args.window_size)
         graph_path = args.img_path_window + "/img/JSON"
         graphene.generate_temporal_graph_frames(graph_path, args.img_path_window + "/img")
     if args.img_path:
-        graphene.classify_images(args.img_path)
-        graph_path = TEMP_DIR
-        graphene.generate_temporal_graph_frames(graph_path, args.img_path)
+        graphene.process_images(args.img_path, args.queue_size)
+    if args.streams:
+        # Every stream writes its own exports to out/<stream name>
+        graphene.process_streams(args.streams, args.text, args.visual, args.text_runs)
+        args.text = args.visual = None
     if args.graph_path:
         graph_path = args.graph_path
-        graphene.generate_temporal_graph(graph_path)
+        if args.segments > 1:
+            graphene.generate_temporal_graph_segments(graph_path, args.segments)
+        else:
+            graphene.generate_temporal_graph(graph_path)
 
     if args.visual:
         graphene.tg.to_plot(os.path.join(OUT_DIR, args.visual))
 
     if args.text:
-        graphene.tg.to_text(os.path.join(OUT_DIR, args.text))
+        graphene.tg.to_text(os.path.join(OUT_DIR, args.text), args.text_runs)
+
+    graphene.generator.close()
+    if cache:
+        cache.close()
+        cache.report()
+    if args.profile:
+        profiler.to_json(os.path.join(OUT_DIR, "profile.json"))
+        profiler.to_prometheus(os.path.join(OUT_DIR, "profile.prom"))
+        print(f"Profile written to {os.path.join(OUT_DIR, 'profile.json')} and {os.path.join(OUT_DIR, 'profile.prom')}")
 
 
 if __name__ == "__main__":
@@ -197,16 +380,59 @@ if __name__ == "__main__":
                         help="amount of frames in the window")
     parser.add_argument("--img_path", type=str,
                         help="Directory of existing images (.jpeg, .jpg, .png) for bulk processing")
+    parser.add_argument("--streams", type=str, nargs="+",
+                        help="Directories of images of several streams (e.g. cameras) that share one scene graph "
+                             "generator, each stream gets its own temporal graph and exports in out/<directory name>")
     parser.add_argument("--graph_path", type=str,
-                        help="Directory of existing scenegraphs (.json) for bulk processing")
+                        help="Directory of existing scenegraphs (.json) or columnar scene graph file (.sgc, see "
+                             "utils/sequences.py) for bulk processing")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="Split --graph_path into this many segments that are built in parallel processes and "
+                             "stitched at the boundaries, for throughput on long recordings")
     parser.add_argument("--cam", type=bool, default=False,
                         help="Run graphene on webcam")
     parser.add_argument("--text", type=str,
                         help="Export graph as natural language text for language model inference under this path")
+    parser.add_argument("--text_runs", action="store_true",
+                        help="Write --text compactly with one line per run of an unchanged relation, e.g. \"From frame "
+                             "3 to 502, cup_1a2b on table_9f0c.\", for smaller language model contexts (not with --cam)")
+    parser.add_argument("--text_sync", type=int, default=SYNC_EVERY,
+                        help="With --cam, number of frames appended to the text export between two syncs to disk")
+    parser.add_argument("--resume", action="store_true",
+                        help="With --cam, continue the text export of an interrupted session instead of overwriting it")
     parser.add_argument("--min_confidence", type=float, default=0.6,
                         help="The minimum confidence required to match an object from one frame to the next")
     parser.add_argument("--alpha", type=float, default=0.3,
                         help="Sets similarity metrics as alpha * neighbour similarity + (1-alpha) * spatial similarity")
     parser.add_argument("--visual", type=str,
                         help="Plots the temporal graph in 3d space")
+    parser.add_argument("--device", type=str, default="cuda",
+                        help="Device RelTR runs on, e.g. cuda or cpu")
+    parser.add_argument("--topk", type=int, default=32,
+                        help="Number of most confident triples RelTR keeps per frame")
+    parser.add_argument("--batch_size", type=int, default=1,
+                        help="Number of frames RelTR processes in one forward pass")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes generating scene graphs in parallel, each loads its own RelTR model")
+    parser.add_argument("--queue_size", type=int, default=QUEUE_SIZE,
+                        help="Maximum number of frames buffered between generation, temporal graph and export stages")
+    parser.add_argument("--skip_similar", type=int,
+                        help="Reuse the previous scene graph for frames whose perceptual hash differs in at most this "
+                             "many of 64 bits from the last processed frame, e.g. 4")
+    parser.add_argument("--max_inactive", type=positive_int,
+                        help="Retire objects not seen for this many frames from matching, they are kept for exports")
+    parser.add_argument("--compact", action="store_true",
+                        help="Store the temporal graph compactly, with object presence and relations as frame intervals")
+    parser.add_argument("--motion", type=str, choices=sorted(MOTION_MODELS),
+                        help="Match objects against boxes predicted by a constant velocity or Kalman motion model, "
+                             "keeps moving objects identified at low frame rates")
+    parser.add_argument("--cache_dir", type=str,
+                        help="Directory of a persistent scene graph cache, unchanged frames are not passed to RelTR again")
+    parser.add_argument("--cache_size", type=int, default=512,
+                        help="Maximum size of the scene graph cache in MB, least recently used graphs are evicted first")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time every pipeline stage and count matches, writes out/profile.json and out/profile.prom")
+    parser.add_argument("--log_level", type=str.upper, default="WARNING",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Logging level, e.g. INFO for one line per frame or DEBUG for every node and edge update")
     main(parser.parse_args())
@@ -1,3 +1,6 @@
+import numpy as np
+
+from structures import boxes
 from utils.inout import *
 
 # TODO: Think about not returning the target object itself
@@ -35,6 +38,75 @@ def get_context_graph(target, environment, epsilon):
     return context
 
 
+class ContextIndex:
+    """
+        Spatial indices over the objects and the triples of one frame. Answers the get_local_context and
+        get_context_graph queries of many targets at once: candidates come from grid cells, the box tests of all
+        (target, candidate) pairs run vectorized. Results are identical to the single target functions
+    """
+
+    def __init__(self, objects=(), triples=()):
+        self.objects = list(objects)
+        self.object_boxes = boxes.to_array(self.objects)
+        self.object_index = boxes.GridIndex(self.object_boxes)
+        self.triples = list(triples)
+        # Subject and object of triple t are entities 2t and 2t + 1
+        entities = [o for triple in self.triples for o in (triple.subject, triple.object)]
+        self.names = {}
+        self.entity_names = np.array([self.names.setdefault(o.name, len(self.names)) for o in entities], dtype=int)
+        self.entity_boxes = boxes.to_array(entities)
+        self.entity_index = boxes.GridIndex(self.entity_boxes)
+
+    def local_contexts(self, targets, epsilon=0.1):
+        """
+        Returns for every target the objects within its proximity box (get_local_context)
+        """
+        t = boxes.to_array(targets)
+        proximity = np.stack([np.maximum(t[:, 0] - epsilon, 0), np.maximum(t[:, 1] - epsilon, 0),
+                              np.minimum(t[:, 2] + epsilon, 1), np.minimum(t[:, 3] + epsilon, 1)], axis=1)
+        rows, cols = self.object_index.candidate_pairs(proximity)
+        within = boxes.paired_containment(self.object_boxes[cols], proximity[rows])
+        contexts = [[] for _ in targets]
+        for i, j in zip(rows[within].tolist(), cols[within].tolist()):
+            contexts[i].append(self.objects[j])
+        return contexts
+
+    def context_graphs(self, targets, epsilon):
+        """
+        Returns for every target the triples whose subject or object is approximately the same (get_context_graph)
+        """
+        t = boxes.to_array(targets)
+        if epsilon <= 1:
+            # Approximately same boxes overlap, so only boxes sharing a grid cell can match
+            rows, cols = self.entity_index.candidate_pairs(t)
+        else:
+            rows = np.repeat(np.arange(len(targets)), len(self.entity_boxes))
+            cols = np.tile(np.arange(len(self.entity_boxes)), len(targets))
+        target_names = np.array([self.names.get(target.name, -1) for target in targets], dtype=int)
+        same = (target_names[rows] == self.entity_names[cols]) & \
+               (1 - boxes.paired_similarity(t[rows], self.entity_boxes[cols]) < epsilon)
+        contexts = [[] for _ in targets]
+        for i, k in zip(rows[same].tolist(), cols[same].tolist()):
+            # A triple is listed once, even if both its subject and object match
+            if not contexts[i] or contexts[i][-1] is not self.triples[k // 2]:
+                contexts[i].append(self.triples[k // 2])
+        return contexts
+
+
+def get_local_contexts(targets, environment, epsilon=0.1):
+    """
+    Batch version of get_local_context, returns the context of every target object
+    """
+    return ContextIndex(objects=environment).local_contexts(targets, epsilon)
+
+
+def get_context_graphs(targets, environment, epsilon):
+    """
+    Batch version of get_context_graph, returns the context triples of every target object
+    """
+    return ContextIndex(triples=environment).context_graphs(targets, epsilon)
+
+
 def test_get_context_graph():
     environment = get_triples("eval/reltr/visualgenome/2361235.json")
     target = environment[5].object # box on desk
@@ -53,6 +125,17 @@ def test_get_local_context():
         print(c)
 
 
+def test_batch_contexts():
+    objects = get_objects("eval/yolo/2361235.json")
+    local_contexts = get_local_contexts(objects, objects, epsilon=0.1)
+    print(all(get_local_context(o, objects, 0.1) == c for o, c in zip(objects, local_contexts)))  # Should be True
+
+    triples = get_triples("eval/reltr/visualgenome/2361235.json")
+    targets = [t.object for t in triples] + [t.subject for t in triples]
+    context_graphs = get_context_graphs(targets, triples, epsilon=0.3)
+    print(all(get_context_graph(o, triples, 0.3) == c for o, c in zip(targets, context_graphs)))  # Should be True
+
+
 if __name__ == "__main__":
     test_get_context_graph()
     # test_get_local_context()
@@ -1,22 +1,37 @@
 import sys
 import openai
 import configparser
-config = configparser.ConfigParser()
-config.read('../config.ini')
-openai.organization = "org-bOaL53AMHfnPzifP0AcjW2Fg"
-openai.api_key = config['DEFAULT']['open_ai_api_key']
-models = openai.Model.list()
+
+configured = False
+
+
+def configure():
+    """
+    Sets the OpenAI credentials on first use, so importing this module does not read the config or touch the network
+    """
+    global configured
+    if configured:
+        return
+    config = configparser.ConfigParser()
+    config.read('../config.ini')
+    openai.organization = "org-bOaL53AMHfnPzifP0AcjW2Fg"
+    openai.api_key = config['DEFAULT']['open_ai_api_key']
+    configured = True
 
 def run_gpt(context, question):
     with open(context) as f:
         context_lines = "".join(map(str,f.readlines())) 
-        response = openai.ChatCompletion.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "system", "content": context_lines},
-                                {"role": "user", "content": question}
-                    ])
+    return ask_gpt(context_lines, question)
+
+def ask_gpt(context_lines, question):
+    configure()
+    response = openai.ChatCompletion.create(
+                model="gpt-3.5-turbo",
+                messages=[{"role": "system", "content": context_lines},
+                            {"role": "user", "content": question}
+                ])
 
     return response.choices[0].message.content
 
 if __name__ == "__main__":
-    print("\nResponse: {}".format(run_gpt(sys.argv[1], sys.argv[2])))
\ No newline at end of file
+    print("\nResponse: {}".format(run_gpt(sys.argv[1], sys.argv[2])))
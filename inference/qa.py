@@ -1,5 +1,17 @@
 from tflite_support.task import text
 import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from retrieval import GraphTextIndex
+
+MODEL_PATH = "ckpt/albert_metadata.tflite"
+LATENCY_WINDOW = 1000  # Number of latest requests the latency metrics are computed over
+LOG_EVERY = 100  # Number of answered questions between metrics log lines
 
 
 class Bert:
@@ -14,9 +26,136 @@ class Bert:
         else: return ""
 
 
+worker_bert = None  # The interpreter of a QAExecutor worker process
+
+
+def load_worker(model_path):
+    global worker_bert
+    worker_bert = Bert(model_path)
+
+
+def answer_in_worker(context, question):
+    return worker_bert.answer(context, question)
+
+
+class QAExecutor:
+    """
+        Answers questions in parallel with a pool of worker processes, each with its own BERT interpreter, so answers
+        do not depend on the interpreter releasing the GIL. Each idle worker takes the next queued question. A question
+        that is identical (same context and question) to one that is still queued or being answered is not queued
+        again, it gets the answer of the earlier one. Keeps queue depth and latency metrics and prints them every
+        log_every answered questions.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, workers=None, log_every=LOG_EVERY):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(self.workers, initializer=load_worker, initargs=(model_path,))
+        # Reentrant, since a question that is answered at once runs its callback while the lock is held
+        self.lock = threading.RLock()
+        self.idle = threading.Condition(self.lock)
+        self.queue = deque()
+        self.pending = {}  # Maps (context, question) to [(future, submit time)] of all its unanswered submissions
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.shared = deque(maxlen=LATENCY_WINDOW)  # Number of submissions answered by each interpreter run
+        self.completed = 0
+        self.in_flight = 0
+        self.log_every = log_every
+        self.logged = 0
+
+    def submit(self, context, question):
+        """
+        Queues a question and returns a Future of its answer
+        """
+        future = Future()
+        key = (context, question)
+        with self.lock:
+            if key in self.pending:
+                self.pending[key].append((future, time.perf_counter()))
+                return future
+            self.pending[key] = [(future, time.perf_counter())]
+            self.queue.append(key)
+            self.dispatch()
+        return future
+
+    def answer(self, context, question, timeout=None):
+        return self.submit(context, question).result(timeout)
+
+    def dispatch(self):
+        """
+        Sends queued questions to idle workers, must be called with the lock held
+        """
+        while self.queue and self.in_flight < self.workers:
+            key = self.queue.popleft()
+            if all(future.cancelled() for future, _ in self.pending[key]):
+                del self.pending[key]
+                continue
+            self.in_flight += 1
+            try:
+                result = self.pool.submit(answer_in_worker, *key)
+            except BrokenProcessPool as e:  # A worker could not load the model or died
+                result = Future()
+                result.set_exception(e)
+            result.add_done_callback(lambda result, key=key: self.done(key, result))
+        if not self.queue and not self.in_flight:
+            self.idle.notify_all()
+
+    def done(self, key, result):
+        with self.lock:
+            waiting = self.pending.pop(key)
+            self.in_flight -= 1
+            self.shared.append(len(waiting))
+            self.dispatch()
+        answered = time.perf_counter()
+        answer, error = None, result.exception()
+        if error is None:
+            answer = result.result()
+        for future, submitted in waiting:
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is None:
+                future.set_result(answer)
+            else:
+                future.set_exception(error)
+            with self.lock:
+                self.latencies.append(answered - submitted)
+                self.completed += 1
+        with self.lock:
+            log = self.log_every and self.completed - self.logged >= self.log_every
+            if log:
+                self.logged = self.completed
+        if log:
+            print(self.report())
+
+    def metrics(self):
+        """
+        Returns queue depth, questions in progress, completed questions, mean number of submissions answered by one
+        interpreter run and latency percentiles in seconds over the latest requests
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+            shared = list(self.shared)
+            metrics = {"queue_depth": len(self.queue), "in_flight": self.in_flight, "completed": self.completed}
+        metrics["answers_per_run"] = sum(shared) / len(shared) if shared else 0
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("max", 1.0)):
+            metrics[f"latency_{name}"] = latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0
+        return metrics
+
+    def report(self):
+        metrics = self.metrics()
+        return (f"QA: {metrics['completed']} answered, {metrics['queue_depth']} queued, {metrics['in_flight']} in "
+                f"progress, {metrics['answers_per_run']:.1f} answers per interpreter run, latency p50 "
+                f"{metrics['latency_p50']:.3f}s p95 {metrics['latency_p95']:.3f}s max {metrics['latency_max']:.3f}s")
+
+    def close(self):
+        # Queued questions are answered before the workers exit
+        with self.idle:
+            self.idle.wait_for(lambda: not self.queue and not self.in_flight)
+        self.pool.shutdown()
+
+
 class Inference:
 
-    def __init__(self, context_path):
+    def __init__(self, context_path, top_k=None, workers=None):
         if not os.path.isfile(context_path):
             print(f"Could not find directory {context_path}")
             self.context = ""
@@ -24,10 +163,59 @@ class Inference:
             with open(context_path, "r") as file:
                 self.context = file.read()
                 file.close()
-        self.langmodel = Bert("ckpt/albert_metadata.tflite")
+        # With top_k, BERT reads the top_k chunks of the context most relevant to the question instead of all of it
+        self.top_k = top_k
+        self.index = GraphTextIndex(self.context) if top_k else None
+        # Concurrent requests are answered in parallel by workers processes, one per core by default
+        self.langmodel = QAExecutor(MODEL_PATH, workers)
 
     def infer(self, question):
         if 5 < len(question) < 60:
-            return self.langmodel.answer(self.context, question)
+            context = self.index.context(question, self.top_k) if self.index else self.context
+            return self.langmodel.answer(context, question)
         else:
             return "Search query too short or too large"
+
+
+def benchmark(model_path, context_path, questions_path, workers=None, top_k=None):
+    """
+    Answers all questions (one per line) once with a single interpreter, one after the other, and once submitted at
+    the same time to a QAExecutor, and prints throughput and latencies of both
+    """
+    with open(context_path, "r") as file:
+        context = file.read()
+        file.close()
+    with open(questions_path, "r") as file:
+        questions = [line.strip() for line in file if line.strip()]
+        file.close()
+    index = GraphTextIndex(context) if top_k else None
+    contexts = [index.context(question, top_k) if index else context for question in questions]
+
+    bert = Bert(model_path)
+    start = time.perf_counter()
+    latencies = []
+    for c, question in zip(contexts, questions):
+        bert.answer(c, question)
+        # Questions that arrive together wait for all questions before them
+        latencies.append(time.perf_counter() - start)
+    sequential = time.perf_counter() - start
+    print(f"Sequential: {len(questions) / sequential:.1f} questions/s, "
+          f"latency p50 {sorted(latencies)[len(latencies) // 2]:.3f}s max {latencies[-1]:.3f}s")
+
+    executor = QAExecutor(model_path, workers, log_every=0)
+    start = time.perf_counter()
+    futures = [executor.submit(c, question) for c, question in zip(contexts, questions)]
+    for future in futures:
+        future.result()
+    duration = time.perf_counter() - start
+    executor.close()
+    print(f"Executor with {executor.workers} workers: {len(questions) / duration:.1f} questions/s")
+    print(executor.report())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage: python qa.py <model.tflite> <graph2text.txt> <questions.txt> [workers] [top_k]")
+        exit(1)
+    benchmark(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else None,
+              int(sys.argv[5]) if len(sys.argv) > 5 else None)
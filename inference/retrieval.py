@@ -0,0 +1,147 @@
+import math
+import re
+import sys
+from collections import Counter, defaultdict
+
+TOP_K = 8
+
+# Words of questions that do not help to find relations
+STOPWORDS = {"a", "an", "and", "are", "at", "did", "do", "does", "for", "frame", "frames", "from", "how", "in", "is",
+             "it", "many", "of", "the", "there", "to", "was", "were", "what", "when", "where", "which", "who", "why"}
+HEADER = re.compile(r"In frame (\d+):$")
+RUN = re.compile(r"(?:From frame (\d+) to (\d+)|In frame (\d+)),")
+WORD = re.compile(r"[a-z0-9]+")
+NUMBER = re.compile(r"\b\d+\b")
+
+
+def tokenize(text):
+    """
+    Splits text into lower case terms, object identifiers like cup_1a2b into name and id. Plural s is removed, so
+    questions about cups find cup_1a2b
+    """
+    terms = []
+    for word in WORD.findall(text.lower()):
+        if word in STOPWORDS or word.isdigit():
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def chunk_text(text):
+    """
+    Splits a graph2text export into chunks as (first frame, last frame, text). A chunk is one frame section
+    ("In frame N:" and its relations) of the frame by frame export, or all runs that start in the same frame of the
+    run-length export (--text_runs)
+    """
+    chunks = []
+    lines = []
+    first = last = None
+    for line in text.splitlines(keepends=True):
+        header = HEADER.match(line.strip())
+        run = RUN.match(line)
+        if header or run:
+            if run and run.group(1) is not None:
+                start, stop = int(run.group(1)), int(run.group(2))
+            else:
+                start = stop = int(header.group(1) if header else run.group(3))
+            if header or start != first:
+                if lines:
+                    chunks.append((first, last, "".join(lines)))
+                lines = []
+                first = last = start
+            last = max(last, stop)
+        lines.append(line)
+    if lines:
+        chunks.append((first, last, "".join(lines)))
+    return chunks
+
+
+class GraphTextIndex:
+    """
+        BM25 index over the chunks of a graph2text export, to send a language model only the chunks that are relevant
+        to a question instead of the whole export. Terms are object names, object identifiers and predicate words.
+        Frame numbers in a question select the chunks whose frames contain them.
+    """
+
+    def __init__(self, text, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks = chunk_text(text)
+        self.postings = defaultdict(list)  # Maps term to [(chunk, term frequency)]
+        self.lengths = []
+        for i, (_, _, chunk) in enumerate(self.chunks):
+            terms = tokenize(chunk)
+            self.lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((i, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r") as file:
+            text = file.read()
+            file.close()
+        return cls(text)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def scores(self, question):
+        """
+        Returns a dict from chunk to BM25 score for all chunks that match a term or frame number of question
+        """
+        scores = defaultdict(float)
+        n = len(self.chunks)
+        for term in set(tokenize(question)):
+            postings = self.postings.get(term, ())
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.average_length)
+                scores[i] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        frames = [int(number) for number in NUMBER.findall(question)]
+        if frames:
+            # Chunks of the asked frames rank first, ordered by their term scores
+            bonus = max(scores.values(), default=0) + math.log(1 + n)
+            for i, (first, last, _) in enumerate(self.chunks):
+                if any(first <= frame <= last for frame in frames):
+                    scores[i] += bonus
+        return scores
+
+    def search(self, question, k=TOP_K):
+        """
+        Returns the indices of the k chunks most relevant to question, best first. Without any match, these are the
+        k latest chunks, which describe the current scene
+        """
+        scores = self.scores(question)
+        if not scores:
+            return list(range(len(self.chunks) - 1, max(len(self.chunks) - k, 0) - 1, -1))
+        return sorted(scores, key=lambda i: (-scores[i], i))[:k]
+
+    def context(self, question, k=TOP_K):
+        """
+        Returns the text of the k chunks most relevant to question in chronological order, as context for a language
+        model
+        """
+        return "".join(self.chunks[i][2] for i in sorted(self.search(question, k)))
+
+
+def test_retrieval():
+    text = ("In frame 0:\ncup_1a2b on table_9f0c.\nperson_77aa near table_9f0c.\n"
+            "In frame 1:\ncup_1a2b on table_9f0c.\n"
+            "In frame 2:\nperson_77aa holding cup_1a2b.\n")
+    index = GraphTextIndex(text)
+    print(len(index) == 3)  # Should be True
+    print(index.search("Who is holding the cup?", 1) == [2])  # Should be True
+    print(index.context("What is on the table in frame 1?", 1) == "In frame 1:\ncup_1a2b on table_9f0c.\n")  # Should be True
+    runs = GraphTextIndex("From frame 0 to 1, cup_1a2b on table_9f0c.\nFrom frame 0 to 0, person_77aa near table_9f0c.\n"
+                          "In frame 2, person_77aa holding cup_1a2b.\n")
+    print(len(runs) == 2 and runs.search("What happened in frame 2?", 1) == [1])  # Should be True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        test_retrieval()
+    else:
+        print(GraphTextIndex.from_file(sys.argv[1]).context(" ".join(sys.argv[2:])))
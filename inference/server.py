@@ -3,11 +3,61 @@ from flask import Flask, render_template, request
 import os
 import shutil
 import sys
+import threading
+import time
 import gpt_ask
+from retrieval import GraphTextIndex, TOP_K
 
 app = Flask(__name__)
 app.config.update(SERVER_NAME='127.0.0.1:5000')
 
+CHECK_INTERVAL = 1.0
+
+
+class GraphContext:
+    """
+        Keeps the graph2text export loaded and indexed in memory, so requests do not read it from disk. graphene
+        rewrites (or in online mode appends to) the export while the server runs: a background thread checks the
+        file's inode, size and modification time every check_interval seconds, builds a new index when they change and
+        swaps it in. Requests only read the current index.
+    """
+
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.signature = None
+        self.index = GraphTextIndex("")
+        self.refresh()
+        self.watcher = threading.Thread(target=self.watch, daemon=True)
+        self.watcher.start()
+
+    def watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.refresh()
+            except (OSError, UnicodeDecodeError) as e:  # Keep serving the last index, e.g. while the file is replaced
+                print(f"Could not reload {self.path}: {e}")
+
+    def refresh(self):
+        """
+        Reloads the export if it changed since it was loaded
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if signature == self.signature:
+            return
+        index = GraphTextIndex.from_file(self.path)
+        self.index = index  # Requests in progress keep using the index they started with
+        self.signature = signature
+        print(f"Loaded {len(index)} chunks of {self.path}")
+
+    def context(self, question, top_k=TOP_K):
+        return self.index.context(question, top_k)
+
 
 @app.route('/')
 def index():
@@ -31,7 +81,8 @@ def search_request():
     if len(query.split(" ")) == 0:
         return index()
 
-    answer = gpt_ask.run_gpt(graph2text, query)
+    # Only the parts of the graph2text export relevant to the question are sent as context
+    answer = gpt_ask.ask_gpt(graph_context.context(query, top_k), query)
     response = {"question": query, "answer": answer}
     return render_template('results.html', res=response)
 
@@ -39,6 +90,8 @@ def search_request():
 if __name__ == "__main__":
     graph2text = sys.argv[1]
     tg_plot = sys.argv[2]
+    top_k = int(sys.argv[3]) if len(sys.argv) > 3 else TOP_K
+    graph_context = GraphContext(graph2text)
     #inference = Inference(graph2text)
     if os.path.isfile(tg_plot):
         shutil.copy(tg_plot, "static/tg.png")
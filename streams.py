@@ -0,0 +1,147 @@
+import os
+from collections import deque
+
+from structures.graph import FrameGraph, plot_frame
+from generator import export_triples
+from utils import inout
+
+
+class Stream:
+    """
+        One input sequence of images (e.g. one camera) with its own temporal graph, temp and output directory.
+        Scene graphs may arrive from a shared generator, they have to arrive in frame order.
+    """
+
+    def __init__(self, name, image_path, tg, temp_dir, out_dir, frame_filter=None):
+        self.name = name
+        self.image_path = image_path
+        self.tg = tg
+        self.temp_dir = temp_dir
+        self.out_dir = out_dir
+        self.ann_path = os.path.join(image_path, "annotated")
+        for path in (temp_dir, out_dir, self.ann_path):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self.images = inout.clean_img_list(sorted(os.listdir(image_path)))
+        self.frame_filter = frame_filter
+        self.next_frame = 0  # First frame that is not in the temporal graph yet
+        self.triples = None  # Scene graph of the last generated frame, reused for near-duplicates
+
+    def pending(self):
+        """
+        Yields (frame number, image path, scene graph path) of all frames that need a scene graph. Frames are checked
+        for near-duplicates one by one as they are requested, duplicates are skipped
+        """
+        if self.frame_filter is not None:
+            self.frame_filter.reset()
+        for image_count, image in enumerate(self.images):
+            img_path = os.path.join(self.image_path, image)
+            if self.frame_filter is not None and self.frame_filter.is_duplicate(img_path):
+                continue
+            yield image_count, img_path, os.path.join(self.temp_dir, "%03d" % image_count + ".json")
+
+    def insert(self, frame, triples, alpha, min_assignment_conf):
+        """
+        Inserts the scene graph of frame, and all near-duplicate frames before it, into the temporal graph.
+        Returns the number of inserted frames
+        """
+        inserted = frame + 1 - self.next_frame
+        self.repeat_until(frame)
+        fg = FrameGraph(frame)
+        fg.create_graph_from_triples(triples)
+        self.tg.insert_framegraph(fg, alpha, min_assignment_conf)
+        self.export_frame(frame)
+        self.triples = triples
+        self.next_frame = frame + 1
+        return inserted
+
+    def repeat_until(self, frame):
+        for image_count in range(self.next_frame, frame):
+            export_triples(self.triples, os.path.join(self.temp_dir, "%03d" % image_count + ".json"))
+            self.tg.repeat_frame(image_count)
+            self.export_frame(image_count)
+        self.next_frame = frame
+
+    def export_frame(self, frame):
+        plot_frame(os.path.join(self.image_path, self.images[frame]), os.path.join(self.ann_path, str(frame)),
+                   self.tg.frame_objects(frame))
+
+    def finish(self, graph2text=None, visual=None, text_runs=False):
+        """
+        Inserts trailing near-duplicate frames and writes the exports of the stream to its output directory.
+        Returns the number of inserted frames
+        """
+        inserted = len(self.images) - self.next_frame
+        self.repeat_until(len(self.images))
+        if visual:
+            self.tg.to_plot(os.path.join(self.out_dir, visual))
+        if graph2text:
+            self.tg.to_text(os.path.join(self.out_dir, graph2text), text_runs)
+        return inserted
+
+
+class StreamScheduler:
+    """
+        Feeds the frames of several streams to one shared scene graph generator (or generator pool).
+        Batches are filled round-robin with one frame per stream in turn, so every stream advances at the same rate
+        and a long stream cannot starve the others. Each following batch continues with the next stream in turn.
+    """
+
+    def __init__(self, streams, generator, batch_size=1):
+        self.streams = streams
+        self.generator = generator
+        self.batch_size = batch_size
+
+    def schedule(self, owners):
+        """
+        Yields the batches as (img_paths, graph_paths) and appends the (stream, frame number) of the images of each
+        batch to owners. Frames are taken from the streams only as batches are requested
+        """
+        queues = [stream.pending() for stream in self.streams]
+        done = [False] * len(queues)
+        batch = []
+        turn = 0
+        while not all(done):
+            i = turn % len(queues)
+            turn += 1
+            if done[i]:
+                continue
+            frame = next(queues[i], None)
+            if frame is None:
+                done[i] = True
+                continue
+            batch.append((i, frame))
+            if len(batch) == self.batch_size:
+                yield self.batch(batch, owners)
+                batch = []
+        if batch:
+            yield self.batch(batch, owners)
+
+    def batch(self, batch, owners):
+        owners.append([(self.streams[i], frame) for i, (frame, _, _) in batch])
+        return [img_path for _, (_, img_path, _) in batch], [graph_path for _, (_, _, graph_path) in batch]
+
+    def run(self, alpha, min_assignment_conf):
+        """
+        Generates the scene graphs of all streams and inserts them into the streams' temporal graphs as they arrive.
+        Yields the number of frames inserted per batch, including skipped near-duplicates before its frames
+        """
+        owners = deque()
+        for batch_triples in self.generator.generate_batches(self.schedule(owners)):
+            inserted = 0
+            for (stream, frame), triples in zip(owners.popleft(), batch_triples):
+                inserted += stream.insert(frame, triples, alpha, min_assignment_conf)
+            yield inserted
+
+
+def stream_names(paths):
+    """
+    Names streams after their directories, adding a number to repeated names
+    """
+    names = []
+    for path in paths:
+        name = os.path.basename(os.path.normpath(path))
+        if name in names:
+            name = f"{name}_{len(names)}"
+        names.append(name)
+    return names
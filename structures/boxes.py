@@ -0,0 +1,171 @@
+from collections import defaultdict
+
+import numpy as np
+
+
+def to_array(objects):
+    """
+    Returns the boxes of SceneObjects as N x 4 array of (xmin, ymin, xmax, ymax)
+    """
+    return np.array([(o.xmin, o.ymin, o.xmax, o.ymax) for o in objects], dtype=float).reshape(-1, 4)
+
+
+def areas(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def intersections(a, b):
+    """
+    Returns N x M matrix of the intersection areas of boxes a (N x 4) and b (M x 4)
+    """
+    w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    return np.clip(w, 0, None) * np.clip(h, 0, None)
+
+
+def iou(a, b):
+    """
+    Returns N x M matrix of the intersection over union of boxes a (N x 4) and b (M x 4), 0 if the union has no area
+    """
+    inter = intersections(a, b)
+    return safe_divide(inter, areas(a)[:, None] + areas(b)[None, :] - inter)
+
+
+def similarity(a, b):
+    """
+    Pairwise SceneObject.box_similarity: overlap relative to the larger of both boxes, 0 if both have no area
+    """
+    larger = np.maximum(areas(a)[:, None], areas(b)[None, :])
+    return safe_divide(intersections(a, b), larger)
+
+
+def overlap(a, b):
+    """
+    Pairwise SceneObject.box_overlap: intersection relative to the area of the box of a, 0 if it has no area
+    """
+    return safe_divide(intersections(a, b), areas(a)[:, None])
+
+
+def containment(a, b):
+    """
+    Pairwise SceneObject.within: N x M boolean matrix telling whether box a[i] lies strictly inside box b[j]
+    """
+    return (a[:, None, 0] > b[None, :, 0]) & (a[:, None, 1] > b[None, :, 1]) & \
+           (a[:, None, 2] < b[None, :, 2]) & (a[:, None, 3] < b[None, :, 3])
+
+
+def paired_containment(a, b):
+    """
+    SceneObject.within of a[i] and b[i] for boxes a and b of the same length
+    """
+    return (a[:, 0] > b[:, 0]) & (a[:, 1] > b[:, 1]) & (a[:, 2] < b[:, 2]) & (a[:, 3] < b[:, 3])
+
+
+def paired_similarity(a, b):
+    """
+    SceneObject.box_similarity of a[i] and b[i] for boxes a and b of the same length
+    """
+    w = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    h = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    return safe_divide(np.clip(w, 0, None) * np.clip(h, 0, None), np.maximum(areas(a), areas(b)))
+
+
+def safe_divide(numerator, denominator):
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+class GridIndex:
+    """
+        Uniform grid over boxes to find all boxes overlapping a query box without comparing against every box.
+        Each box is registered in all cells it covers, a query only looks at the boxes in the cells the query covers.
+    """
+
+    def __init__(self, boxes, cells=None):
+        self.boxes = boxes
+        if cells is None:
+            cells = max(1, int(np.sqrt(len(boxes))))
+        self.cells = cells
+        self.grid = defaultdict(list)
+        if len(boxes) == 0:
+            return
+        self.origin = boxes[:, :2].min(axis=0)
+        extent = boxes[:, 2:].max(axis=0) - self.origin
+        self.cell_size = np.maximum(extent / cells, 1e-9)
+        for i, box in enumerate(boxes):
+            (x0, y0), (x1, y1) = self.cell_range(box)
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    self.grid[cx, cy].append(i)
+
+    def cell_range(self, box):
+        """
+        Returns the first and last cell (x, y) covered by box, clipped to the grid
+        """
+        first = np.clip((box[:2] - self.origin) // self.cell_size, 0, self.cells - 1).astype(int)
+        last = np.clip((box[2:] - self.origin) // self.cell_size, 0, self.cells - 1).astype(int)
+        return first, last
+
+    def candidates(self, box):
+        """
+        Returns the sorted indices of all boxes registered in the cells box covers, a superset of the boxes that
+        overlap or lie within box
+        """
+        if len(self.boxes) == 0:
+            return np.zeros(0, dtype=int)
+        (x0, y0), (x1, y1) = self.cell_range(box)
+        candidates = set()
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                candidates.update(self.grid.get((cx, cy), ()))
+        return np.array(sorted(candidates), dtype=int)
+
+    def candidate_pairs(self, query_boxes):
+        """
+        Returns (rows, cols) of all pairs of a query box (row of query_boxes) and a candidate box of it
+        """
+        rows = []
+        cols = []
+        for i, box in enumerate(query_boxes):
+            candidates = self.candidates(box)
+            rows.append(np.full(len(candidates), i, dtype=int))
+            cols.append(candidates)
+        if not rows:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        return np.concatenate(rows), np.concatenate(cols)
+
+    def query(self, box):
+        """
+        Returns the indices of all boxes that overlap box with a positive area
+        """
+        candidates = self.candidates(box)
+        if len(candidates) == 0:
+            return candidates
+        overlap = intersections(box[None, :], self.boxes[candidates])[0]
+        return candidates[overlap > 0]
+
+
+def test_equivalence():
+    from structures.scene import SceneObject
+
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, 10, (60, 2))
+    sizes = rng.uniform(0, 5, (60, 2))
+    sizes[::7] = 0  # Degenerate boxes without area
+    sizes[1::7, 0] = 0
+    b = np.concatenate([corners, corners + sizes], axis=1)
+    objects = [SceneObject("o", *box) for box in b.tolist()]
+    print(np.allclose(similarity(b, b), [[o.box_similarity(p) for p in objects] for o in objects]))  # Should be True
+    print(np.allclose(overlap(b, b), [[o.box_overlap(p) for p in objects] for o in objects]))  # Should be True
+    print(np.array_equal(containment(b, b), [[o.within(p) for p in b] for o in objects]))  # Should be True
+    print(np.array_equal(paired_containment(b, b[::-1]), [o.within(p) for o, p in zip(objects, b[::-1])]))  # True
+    print(np.allclose(paired_similarity(b, b[::-1]), [o.box_similarity(p) for o, p in zip(objects, objects[::-1])]))
+    inter = [[max(min(o.xmax, p.xmax) - max(o.xmin, p.xmin), 0) * max(min(o.ymax, p.ymax) - max(o.ymin, p.ymin), 0)
+              for p in objects] for o in objects]
+    union = [[o.area + p.area - inter[i][j] for j, p in enumerate(objects)] for i, o in enumerate(objects)]
+    print(np.allclose(iou(b, b), [[i / u if u > 0 else 0 for i, u in zip(r, s)] for r, s in zip(inter, union)]))
+
+
+if __name__ == "__main__":
+    test_equivalence()
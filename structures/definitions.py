@@ -1,4 +1,5 @@
 import networkx as nx
+import numpy as np
 
 elist = [('hand', 'arm', 0.5), ('hand', 'person', 0.2), ('hand', 'finger', 0.6), ('glass', 'cup', 0.8),
          ('glass', 'cup', 0.8), ('person', 'woman', 0.8), ('person', 'man', 0.8), ('mouth', 'person', 0.4),
@@ -23,6 +24,30 @@ relation_to_text = {'above': 'was above', 'across': 'was across', 'against': 'wa
                     'watching': 'watched', 'wearing': 'wore', 'wears': 'wore', 'with': 'was with'}
 
 
+# Visual Genome labels of the RelTR checkpoint, index 0 is the "no object" / "no relation" class
+CLASSES = ['N/A', 'airplane', 'animal', 'arm', 'bag', 'banana', 'basket', 'beach', 'bear', 'bed', 'bench', 'bike',
+           'bird', 'board', 'boat', 'book', 'boot', 'bottle', 'bowl', 'box', 'boy', 'branch', 'building', 'bus',
+           'cabinet', 'cap', 'car', 'cat', 'chair', 'child', 'clock', 'coat', 'counter', 'cow', 'cup', 'curtain',
+           'desk', 'dog', 'door', 'drawer', 'ear', 'elephant', 'engine', 'eye', 'face', 'fence', 'finger', 'flag',
+           'flower', 'food', 'fork', 'fruit', 'giraffe', 'girl', 'glass', 'glove', 'guy', 'hair', 'hand', 'handle',
+           'hat', 'head', 'helmet', 'hill', 'horse', 'house', 'jacket', 'jean', 'kid', 'kite', 'lady', 'lamp',
+           'laptop', 'leaf', 'leg', 'letter', 'light', 'logo', 'man', 'men', 'motorcycle', 'mountain', 'mouth',
+           'neck', 'nose', 'number', 'orange', 'pant', 'paper', 'paw', 'people', 'person', 'phone', 'pillow',
+           'pizza', 'plane', 'plant', 'plate', 'player', 'pole', 'post', 'pot', 'racket', 'railing', 'rock', 'roof',
+           'room', 'screen', 'seat', 'sheep', 'shelf', 'shirt', 'shoe', 'short', 'sidewalk', 'sign', 'sink',
+           'skateboard', 'ski', 'skier', 'sneaker', 'snow', 'sock', 'stand', 'street', 'surfboard', 'table', 'tail',
+           'tie', 'tile', 'tire', 'toilet', 'towel', 'tower', 'track', 'train', 'tree', 'truck', 'trunk', 'umbrella',
+           'vase', 'vegetable', 'vehicle', 'wave', 'wheel', 'window', 'windshield', 'wing', 'wire', 'woman', 'zebra']
+
+# Predicate labels of the RelTR checkpoint, in the order of its relation classifier
+REL_CLASSES = ['__background__', 'above', 'across', 'against', 'along', 'and', 'at', 'attached to', 'behind',
+               'belonging to', 'between', 'carrying', 'covered in', 'covering', 'eating', 'flying in', 'for', 'from',
+               'growing on', 'hanging from', 'has', 'holding', 'in', 'in front of', 'laying on', 'looking at',
+               'lying on', 'made of', 'mounted on', 'near', 'of', 'on', 'on back of', 'over', 'painted on', 'parked on',
+               'part of', 'playing', 'riding', 'says', 'sitting on', 'standing on', 'to', 'under', 'using',
+               'walking in', 'walking on', 'watching', 'wearing', 'wears', 'with']
+
+
 def name_similarity(a, b):
     """
     Returns graph with name similarities for fuzzy matching
@@ -36,6 +61,33 @@ def name_similarity(a, b):
             return 0
 
 
+def similar_names(name):
+    """
+    Returns all names with a name similarity above 0 to name, including name itself
+    """
+    if name in SIMILAR_NAMES:
+        return [name] + [n for n in SIMILAR_NAMES[name] if SIMILAR_NAMES[name][n]["weight"] > 0]
+    return [name]
+
+
+def paired_name_similarity(a, b):
+    """
+    Returns the name similarities of a[i] and b[i] for name lists a and b of the same length
+    """
+    unique_similarity, index_a, index_b = unique_name_similarity(a, b)
+    return unique_similarity[index_a, index_b]
+
+
+def unique_name_similarity(a, b):
+    """
+    Returns the similarity matrix of the distinct names in a and b and the index of each name in that matrix
+    """
+    unique_a, index_a = np.unique(np.asarray(a, dtype=str), return_inverse=True)
+    unique_b, index_b = np.unique(np.asarray(b, dtype=str), return_inverse=True)
+    unique_similarity = np.array([[name_similarity(x, y) for y in unique_b] for x in unique_a], dtype=float)
+    return unique_similarity.reshape(len(unique_a), len(unique_b)), index_a, index_b
+
+
 def convert_to_text(relation):
     if relation in relation_to_text.keys():
         return relation_to_text[relation]
@@ -1,16 +1,24 @@
 import networkx as nx
-import json
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d.art3d import Line3DCollection
 from PIL import Image
 import uuid
+import logging
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, Counter
 
 import utils.plot
-from structures.scene import SceneObject
-from structures.definitions import name_similarity, convert_to_text
-from utils import plot
+from scipy.optimize import linear_sum_assignment
+
+from structures import boxes
+from structures.intervals import FrameSet, RelationRuns
+from structures.scene import SceneGraphArrays
+from structures.store import NodeStore
+from structures.definitions import paired_name_similarity, similar_names, convert_to_text
+from utils import plot, inout
+from utils.profiler import profiler
+
+logger = logging.getLogger(__name__)
 
 
 class FrameGraph:
@@ -18,35 +26,43 @@ class FrameGraph:
     def __init__(self, frame_id):
         self.g = nx.DiGraph()
         self.frame_id = frame_id
+        self.neighbours = defaultdict(Counter)  # Maps each node to the name counts of its neighbours
 
     def create_graph(self, graph_path):
         """
             Creates graph for a single frame
         """
-        similarity_tol = 0.5
-
-        print("Creating frame graph...")
-        with open(graph_path, "r") as file:
-            triples = json.load(file)
-            file.close()
+        logger.debug("Creating frame graph...")
+        self.create_graph_from_arrays(inout.load_triple_arrays(graph_path, dtype=float))
 
-        for triple_dict in triples:
-            sub = triple_dict["subject"]
-            pred = triple_dict["predicate"]
-            obj = triple_dict["object"]
-            # print("Got triple: subj = ", sub, " pred = ", pred, " obj = ", obj)
-            sub_obj = SceneObject(sub["id"], sub["xmin"], sub["ymin"], sub["xmax"], sub["ymax"])
+    def create_graph_from_triples(self, triples):
+        """
+            Creates graph for a single frame from triples in the RelTR JSON format
+        """
+        self.create_graph_from_arrays(SceneGraphArrays.from_json(triples, dtype=float))
 
-            predicate = pred["id"]
-            obj_obj = SceneObject(obj["id"], obj["xmin"], obj["ymin"], obj["xmax"], obj["ymax"])
+    @profiler.timed("create_graph")
+    def create_graph_from_arrays(self, arrays):
+        """
+            Creates graph for a single frame from SceneGraphArrays, SceneObjects are only created for the nodes
+        """
+        similarity_tol = 0.5
+        profiler.count("triples", len(arrays))
 
-            graph_subj = self.get_closest_node(sub_obj, epsilon=similarity_tol)
-            graph_obj = self.get_closest_node(obj_obj, epsilon=similarity_tol)
+        # Subject and object of triple t are entities 2t and 2t + 1
+        closest = closest_objects(arrays.entity_ids(), arrays.entity_boxes().astype(float), similarity_tol)
+        objects = {}
+        for k in sorted(set(closest)):
+            objects[k] = arrays.scene_object(k)
 
+        for t in range(len(arrays)):
+            graph_subj, graph_obj = objects[closest[2 * t]], objects[closest[2 * t + 1]]
             # adding nodes and edges gets ignored in graph if already exists so no additional check necessary
             self.g.add_node(graph_subj)
             self.g.add_node(graph_obj)
-            self.g.add_edge(graph_subj, graph_obj, relation=predicate)
+            if not self.g.has_edge(graph_subj, graph_obj):
+                self.neighbours[graph_subj][graph_obj.name] += 1
+            self.g.add_edge(graph_subj, graph_obj, relation=arrays.predicate(t))
 
     def get_closest_node(self, subj, epsilon=0.3):
         """
@@ -86,63 +102,63 @@ class FrameGraph:
 
 class TemporalGraph:
 
-    def __init__(self):
+    def __init__(self, max_inactive=None, compact=False, motion=None):
+        if max_inactive is not None and max_inactive < 1:
+            # Nodes would be retired in the frame they are inserted and never matched across frames
+            raise ValueError(f"max_inactive must be at least 1, got {max_inactive}")
         self.g = nx.DiGraph()
         self.frame_ids = []
-
+        # Latest box and label of every live node as arrays for matching. In the compact backend the store is the only
+        # copy of the nodes' SceneObjects, node frames are FrameSets and edge relations RelationRuns (intervals)
+        self.store = NodeStore()
+        self.compact = compact
+        # Nodes that were not seen for max_inactive frames are retired: they leave the matching set and move with
+        # their edges to the archive, where frames and relations are stored as intervals. Exports include the archive
+        self.max_inactive = max_inactive
+        self.archived_nodes = {}  # Maps node identifier to {"content": SceneObject, "frames": FrameSet}
+        self.archived_edges = {}  # Maps (n1, n2) to RelationRuns
+        # Optional motion model (structures.motion): frame nodes are matched against the boxes it predicts for the
+        # current frame instead of the last seen boxes, so moving objects keep their identity at low frame rates
+        self.motion = motion
+        if motion is not None:
+            motion.attach(self.store)
+
+    @profiler.timed("insert_framegraph")
     def insert_framegraph(self, framegraph, alpha, min_assignment_conf, verbose=False):
         '''
         Inserts a framegraph into the temporal graph by matching nodes when their similarity is above min_assignment_conf.
-        Similarity is determined by alpha * neighbour similarity + (1-alpha) * spatial similarity
+        Similarity is determined by alpha * neighbour similarity + (1-alpha) * spatial similarity.
+        Returns the mapping of frame nodes to node identifiers in the temporal graph
         '''
-        if verbose:
-            print(f"-------------\nInserting framegraph with id {framegraph.frame_id}\n-------------")
+        logger.log(logging.INFO if verbose else logging.DEBUG, "Inserting framegraph with id %s", framegraph.frame_id)
         self.frame_ids.append(framegraph.frame_id)
-        temporal_nodes = set(self.g.nodes)
+        frame_nodes = list(framegraph.g.nodes())
+        temporal_nodes = list(self.store.ids)
         f2t = {}  # Maps from FrameNode to node identifier in temporal graph
 
-        for f in framegraph.g.nodes():
-            best_match = None
-            best_similarity = -1
-            for t in temporal_nodes:
-
-                # Count how many neighbours are shared
-                neigh_similarity = 0
-                neighbor_matches = 0
-                n_neighbours = len(self.g[t])
-                if n_neighbours > 0:
-                    for nt in self.g[t]:
-                        for nf in framegraph.g[f]:
-                            if self.g.nodes[nt]["content"].name == nf.name:
-                                neighbor_matches += 1
-                    neigh_similarity = neighbor_matches / len(self.g[t])
-
-                # Compare bounding box similarity
-                spat_similarity = f.box_similarity(self.g.nodes[t]["content"])
-
-                # Compare name similarity
-                n_similarity = name_similarity(f.name, self.g.nodes[t]["content"].name)
-
-                similarity = (alpha * neigh_similarity + (1-alpha) * spat_similarity + n_similarity) / 2
-
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match = t
+        similarity = self.similarity_matrix(framegraph, frame_nodes, temporal_nodes, alpha, min_assignment_conf)
+        matches = assign(similarity, min_assignment_conf)
 
+        for i, f in enumerate(frame_nodes):
             # Add or update node
-            if best_similarity < min_assignment_conf:
+            if i not in matches:
+                best_similarity = similarity[i].max() if len(temporal_nodes) > 0 else -1
                 uid = str(uuid.uuid4())[0:4]
                 node_identifier = f"{f.name}_{uid}"
-                self.g.add_node(node_identifier, content=f)
+                self.add_node(node_identifier, f)
                 f2t[f] = node_identifier
-                self.g.nodes[node_identifier]["frames"] = set()
-                print(f"Creating new node {node_identifier} for {f.name} and match confidence {best_similarity}")
+                profiler.count("nodes_created")
+                logger.debug("Creating new node %s for %s and match confidence %s", node_identifier, f.name,
+                             best_similarity)
             else:
-                self.g.nodes[best_match]["content"] = f
-                temporal_nodes.remove(best_match)  # Reduce matching space
+                best_match = temporal_nodes[matches[i]]
+                self.update_content(best_match, f)
                 f2t[f] = best_match
-                print(f"Updating node {best_match} with {f.name} and match confidence {best_similarity}")
+                profiler.count("nodes_updated")
+                logger.debug("Updating node %s with %s and match confidence %s", best_match, f.name,
+                             similarity[i, matches[i]])
             self.g.nodes[f2t[f]]["frames"].add(framegraph.frame_id)
+            self.g.nodes[f2t[f]]["last_seen"] = len(self.frame_ids) - 1
 
         for n1, n2 in framegraph.g.edges:
             if framegraph.g[n1][n2]["relation"]:
@@ -152,23 +168,178 @@ class TemporalGraph:
 
             if (f2t[n1], f2t[n2]) not in self.g.edges:  # If edge does not exist
                 d = {framegraph.frame_id: relation}
-                self.g.add_edge(f2t[n1], f2t[n2], relations=d)
-                print(f"Creating new edge: {n1} {relation} {n2}")
+                self.g.add_edge(f2t[n1], f2t[n2], relations=RelationRuns(d) if self.compact else d)
+                self.g.nodes[f2t[n1]]["neighbours"][self.store.name(f2t[n2])] += 1
+                profiler.count("edges_created")
+                logger.debug("Creating new edge: %s %s %s", n1, relation, n2)
             else:  # append to edge
                 self.g[f2t[n1]][f2t[n2]]["relations"][framegraph.frame_id] = relation
-                print(f"Updating edge: {n1} {relation} {n2}")
+                profiler.count("edges_updated")
+                logger.debug("Updating edge: %s %s %s", n1, relation, n2)
+        self.retire_inactive()
+        return f2t
+
+    def similarity_matrix(self, framegraph, frame_nodes, temporal_nodes, alpha, min_assignment_conf):
+        """
+        Returns the similarities of all frame nodes (rows) to all temporal nodes (columns) as
+        (alpha * neighbour similarity + (1-alpha) * spatial similarity + name similarity) / 2.
+        Only candidate pairs that can reach min_assignment_conf are scored, all other pairs are 0
+        """
+        temporal_names = self.store.names()
+        frame_boxes = boxes.to_array(frame_nodes)
+        temporal_boxes = self.predicted_boxes()
+
+        frame_signatures = [framegraph.neighbours[f] for f in frame_nodes]
+        names = {}  # Only names of neighbours in this frame can be shared
+        for signature in frame_signatures:
+            for name in signature:
+                names.setdefault(name, len(names))
+        frame_neighbours = neighbour_counts(frame_signatures, names)
+
+        rows, cols = candidate_pairs(frame_nodes, frame_boxes, temporal_names, temporal_boxes,
+                                     frame_neighbours, alpha, min_assignment_conf)
+        profiler.count("candidate_pairs", len(rows))
+        profiler.count("possible_pairs", len(frame_nodes) * len(temporal_nodes))
+        similarity = np.zeros((len(frame_nodes), len(temporal_nodes)))
+        if len(rows) == 0:
+            return similarity
+
+        # Compare bounding box similarity
+        spat_similarity = boxes.paired_similarity(frame_boxes[rows], temporal_boxes[cols])
+
+        # Compare name similarity
+        n_similarity = paired_name_similarity([frame_nodes[i].name for i in rows],
+                                              [temporal_names[j] for j in cols])
+
+        # Count how many neighbours are shared: neighbour name counts of f dotted with those of t, relative to t's degree
+        candidates, cols_index = np.unique(cols, return_inverse=True)
+        temporal_neighbours = neighbour_counts([self.g.nodes[temporal_nodes[j]]["neighbours"] for j in candidates],
+                                               names)
+        n_neighbours = np.array([len(self.g[temporal_nodes[j]]) for j in candidates], dtype=float)
+        neighbour_matches = (frame_neighbours[rows] * temporal_neighbours[cols_index]).sum(axis=1)
+        neigh_similarity = boxes.safe_divide(neighbour_matches, n_neighbours[cols_index])
+
+        similarity[rows, cols] = (alpha * neigh_similarity + (1 - alpha) * spat_similarity + n_similarity) / 2
+        return similarity
+
+    def predicted_boxes(self):
+        """
+        Returns the boxes of all live nodes in the current frame as N x 4 array, in the order of the store's ids
+        """
+        if self.motion is None:
+            return self.store.active_boxes()
+        return self.motion.predict(self.store, len(self.frame_ids) - 1)
+
+    def add_node(self, n, content):
+        self.g.add_node(n, neighbours=Counter(), frames=FrameSet() if self.compact else set())
+        if not self.compact:
+            self.g.nodes[n]["content"] = content
+        self.store.add(n, content)
+        if self.motion is not None:
+            self.motion.start(self.store, n, len(self.frame_ids) - 1)
+
+    def content(self, n):
+        """
+        Returns the latest SceneObject of live node n
+        """
+        if self.compact:
+            return self.store.content(n)
+        return self.g.nodes[n]["content"]
 
+    def update_content(self, n, content):
+        """
+        Replaces the SceneObject of node n and keeps the neighbour name counts of its predecessors up to date
+        """
+        old_name = self.store.name(n)
+        if not self.compact:
+            self.g.nodes[n]["content"] = content
+        self.store.update(n, content)
+        if self.motion is not None:
+            self.motion.observe(self.store, n, len(self.frame_ids) - 1)
+        if content.name != old_name:
+            for p in self.g.predecessors(n):
+                neighbours = self.g.nodes[p]["neighbours"]
+                neighbours[old_name] -= 1
+                if neighbours[old_name] == 0:
+                    del neighbours[old_name]
+                neighbours[content.name] += 1
+
+    def repeat_frame(self, frame_id):
+        """
+        Inserts frame frame_id as unchanged copy of the last inserted frame, e.g. for skipped near-duplicate frames
+        """
+        last_frame = self.frame_ids[-1]
+        self.frame_ids.append(frame_id)
+        for n in self.g.nodes:
+            if last_frame in self.g.nodes[n]["frames"]:
+                self.g.nodes[n]["frames"].add(frame_id)
+                self.g.nodes[n]["last_seen"] = len(self.frame_ids) - 1
+        for n1, n2 in self.g.edges:
+            relations = self.g[n1][n2]["relations"]
+            if last_frame in relations:
+                relations[frame_id] = relations[last_frame]
+        self.retire_inactive()
 
-    def to_text(self, export_path):
+    def retire_inactive(self):
+        """
+        Moves all nodes that were not seen in the last max_inactive frames to the archive
+        """
+        if self.max_inactive is None:
+            return
+        position = len(self.frame_ids) - 1
+        for n in [n for n in self.g.nodes if position - self.g.nodes[n]["last_seen"] >= self.max_inactive]:
+            self.retire(n)
+
+    def retire(self, n):
+        """
+        Moves node n and all its edges from the live graph to the archive
+        """
+        profiler.count("nodes_retired")
+        name = self.store.name(n)
+        for n1, n2 in set(self.g.in_edges(n)) | set(self.g.out_edges(n)):
+            relations = self.g[n1][n2]["relations"]
+            self.archived_edges[n1, n2] = relations if self.compact else RelationRuns(relations)
+            if n2 == n and n1 != n:
+                neighbours = self.g.nodes[n1]["neighbours"]
+                neighbours[name] -= 1
+                if neighbours[name] == 0:
+                    del neighbours[name]
+        frames = self.g.nodes[n]["frames"]
+        self.archived_nodes[n] = {"content": self.content(n), "frames": frames if self.compact else FrameSet(frames)}
+        self.g.remove_node(n)
+        self.store.remove(n)
+
+    def export_graph(self):
+        """
+        Returns a graph of all live and archived nodes and edges, which is the live graph if nothing was retired
+        """
+        if not self.archived_nodes and not self.compact:
+            return self.g
+        g = self.g.copy()
+        if self.compact:
+            for n in self.store.ids:
+                g.nodes[n]["content"] = self.store.content(n)
+        for n, data in self.archived_nodes.items():
+            g.add_node(n, **data)
+        for (n1, n2), relations in self.archived_edges.items():
+            g.add_edge(n1, n2, relations=relations)
+        return g
+
+    @profiler.timed("to_text")
+    def to_text(self, export_path, runs=False):
         """
         Writes the temporal graph to a text file, where each frame is a section and the frames and relations are listed in chronological order.
+        With runs, relations that hold unchanged over consecutive frames are written once as interval instead.
         """
+        if runs:
+            return self.to_text_runs(export_path)
         stories = defaultdict(list)
+        g = self.export_graph()
         # print(self.g.edges(data=True)) 
         # In the original code g was a nx.Graph and even though this object looks like a list of tuples, 
         # it is an EdgeView a custom reportview object of networkx. For an EdgeView the in operator is implemented differently then for a list of tuples.
-        for n1, n2 in self.g.edges:
-            relations = self.g[n1][n2]["relations"]
+        for n1, n2 in g.edges:
+            relations = g[n1][n2]["relations"]
             for frame, relation in list(relations.items()):
                 story = f"{n1} {relation} {n2}.\n"
                 stories[frame].append(story)
@@ -178,38 +349,75 @@ class TemporalGraph:
                 file.write("".join(stories[frame]))
             file.close()
 
+    def to_text_runs(self, export_path):
+        """
+        Writes the temporal graph to a text file with one line per run of a relation over consecutive frames,
+        e.g. "From frame 3 to 502, cup_1a2b on table_9f0c.", so only changes of relations are written.
+        Lines are ordered by the first frame of their run. Prints and returns the compression ratio, the size of the
+        frame by frame export divided by the size of this one
+        """
+        stories = defaultdict(list)
+        frames = set()
+        full_size = 0
+        g = self.export_graph()
+        for n1, n2 in g.edges:
+            relations = g[n1][n2]["relations"]
+            if not isinstance(relations, RelationRuns):
+                relations = RelationRuns(relations)
+            for first, last, relation in relations.runs():
+                if first == last:
+                    story = f"In frame {first}, {n1} {relation} {n2}.\n"
+                else:
+                    story = f"From frame {first} to {last}, {n1} {relation} {n2}.\n"
+                stories[first].append(story)
+                frames.update(range(first, last + 1))
+                full_size += (last - first + 1) * len(f"{n1} {relation} {n2}.\n")
+        full_size += sum(len(f"In frame {frame}:\n") for frame in frames)
+        text = "".join(story for first in sorted(stories.keys()) for story in stories[first])
+        with open(export_path, "w") as file:
+            file.write(text)
+            file.close()
+        size = len(text)
+        ratio = full_size / size if size else 1.0
+        print(f"Text export: {size} instead of {full_size} characters, compression ratio {ratio:.1f}")
+        return ratio
+
+    def frame_stories(self, frame_id, edges):
+        """
+        Returns the lines of frame frame_id in the text export for edges, a list of (n1, n2) of live edges,
+        without going through the rest of the graph
+        """
+        return [f"{n1} {self.g[n1][n2]['relations'][frame_id]} {n2}.\n" for n1, n2 in edges]
+
     def to_frame_plot(self, img_path, export_path, frame_id):
         """
         Draws, with the addition of the image, the current framegraph as overlay
         """
-        fig, ax = plt.subplots()
-        im = plt.imread(img_path)
-        ax.imshow(im)
-        ax.set_axis_off()
-        for n in self.g.nodes():
-            if frame_id not in self.g.nodes[n]["frames"]:
-                continue
-            o = self.g.nodes[n]["content"]
-            oxcentre = o.xmin + (o.xmax - o.xmin) / 2
-            oycentre = o.ymin + (o.ymax - o.ymin) / 2
-            ax.add_patch(plt.Rectangle((o.xmin, o.ymin), o.xmax - o.xmin, o.ymax - o.ymin,
-                                       fill=False, color="blue", linewidth=2.5))
-            ax.annotate(n, (o.xmin, o.ymin), color="white")
-        plt.savefig(export_path + ".png", dpi=200, bbox_inches="tight")
+        plot_frame(img_path, export_path, self.frame_objects(frame_id))
+
+    def frame_objects(self, frame_id):
+        """
+        Returns (node identifier, SceneObject) of all nodes present in frame frame_id
+        """
+        objects = [(n, self.content(n)) for n in self.g.nodes() if frame_id in self.g.nodes[n]["frames"]]
+        objects += [(n, data["content"]) for n, data in self.archived_nodes.items() if frame_id in data["frames"]]
+        return objects
 
+    @profiler.timed("to_plot")
     def to_plot(self, export_path):
         """
         Plots the temporal graph in 3d space. Works best for < 5 frames.
         Inspired by https://stackoverflow.com/questions/60392940/multi-layer-graph-in-networkx
         """
+        g = self.export_graph()
         fig = plt.figure(figsize=(8, 8))
         ax = fig.add_subplot(111, projection='3d')
         ax.set_axis_off()
         cmap = plt.get_cmap("plasma")
-        colors = cmap(np.linspace(0, 1, len(self.g.nodes)))
-        node2color = dict(zip(self.g.nodes, colors))
+        colors = cmap(np.linspace(0, 1, len(g.nodes)))
+        node2color = dict(zip(g.nodes, colors))
 
-        positions = nx.spring_layout(self.g)
+        positions = nx.spring_layout(g)
         xmin, ymin = np.min(list(positions.values()), axis=0)
         xmax, ymax = np.max(list(positions.values()), axis=0)
 
@@ -231,26 +439,127 @@ class TemporalGraph:
 
             # Plot edges
             graph_segments = []
-            for n1, n2 in self.g.edges:
-                if f in self.g[n1][n2]["relations"].keys():  # Check whether edge (n1, n2) exists in frame f
+            for n1, n2 in g.edges:
+                if f in g[n1][n2]["relations"]:  # Check whether edge (n1, n2) exists in frame f
                     graph_segments.append(((*positions[n1], i), (*positions[n2], i)))
             ax.add_collection3d(Line3DCollection(graph_segments, color="k", alpha=0.5, linestyle="-", linewidth=0.5, zorder=2))
 
             # Plot nodes
             time_segments = []
-            for n in self.g.nodes:
-                if f in self.g.nodes[n]["frames"]:  # Check whether node n exists in frame f
+            for n in g.nodes:
+                if f in g.nodes[n]["frames"]:  # Check whether node n exists in frame f
                     ax.scatter(*positions[n], i, color=node2color[n], s=50, zorder=3)
                     ax.text(*positions[n], i, n, fontsize='xx-small', horizontalalignment='center', verticalalignment='center', zorder=100)
                     # Draw edges between frames
                     if i != 0:
                         prev_f = self.frame_ids[i-1]
-                        if prev_f in self.g.nodes[n]["frames"]: # if node existed in previous frame
+                        if prev_f in g.nodes[n]["frames"]: # if node existed in previous frame
                             time_segments.append(((*positions[n], i-1), (*positions[n], i)))
             ax.add_collection3d(Line3DCollection(time_segments, color="k", alpha=0.3, linestyle="--", linewidth=0.5, zorder=2))                  
         plt.savefig(export_path, dpi=300, bbox_inches="tight")
 
 
+def closest_objects(name_ids, box_array, epsilon):
+    """
+    Deduplicates the subjects and objects of a frame's triples, given as name ids and box matrix where entities 2t and
+    2t + 1 are subject and object of triple t. Returns for each entity the index of the entity that becomes its node:
+    the first earlier entity of the same name whose box similarity exceeds 1 - epsilon (as
+    FrameGraph.get_closest_node), otherwise itself. Subject and object are both compared with the nodes of the previous
+    triples only. Box similarities are computed per name in one pass, like non-maximum suppression
+    """
+    closest = list(range(len(name_ids)))
+    is_node = np.zeros(len(name_ids), dtype=bool)
+    order = np.argsort(name_ids, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(name_ids[order])) + 1) if len(order) > 0 else []
+    for members in groups:
+        same = 1 - boxes.similarity(box_array[members], box_array[members]) < epsilon
+        for p, k in enumerate(members):
+            # Earlier members that are nodes, in node insertion order
+            candidates = members[same[p] & is_node[members] & (members < k - k % 2)]
+            if len(candidates) > 0:
+                closest[k] = candidates[0]
+            else:
+                is_node[k] = True
+    return closest
+
+
+def neighbour_counts(signatures, names):
+    """
+    Returns a matrix with one row per neighbour name signature (a Counter of neighbour names), names maps a name
+    to its column. Names without a column are ignored
+    """
+    counts = np.zeros((len(signatures), len(names)))
+    for i, signature in enumerate(signatures):
+        for name, count in signature.items():
+            if name in names:
+                counts[i, names[name]] = count
+    return counts
+
+
+def candidate_pairs(frame_nodes, frame_boxes, temporal_names, temporal_boxes, frame_neighbours, alpha,
+                    min_assignment_conf):
+    """
+    Returns (rows, cols) of the frame / temporal node pairs that can reach min_assignment_conf.
+    A pair without box overlap and name similarity scores at most alpha * neighbour similarity / 2, where the
+    neighbour similarity is bounded by the highest count of one name among the frame node's neighbours.
+    Frame nodes that can exceed the threshold that way are paired with all temporal nodes
+    """
+    max_neighbour_similarity = frame_neighbours.max(axis=1) if frame_neighbours.shape[1] > 0 \
+        else np.zeros(len(frame_nodes))
+    index = boxes.GridIndex(temporal_boxes)
+    by_name = defaultdict(list)
+    for j, name in enumerate(temporal_names):
+        by_name[name].append(j)
+
+    rows = []
+    cols = []
+    for i, f in enumerate(frame_nodes):
+        if alpha * max_neighbour_similarity[i] / 2 >= min_assignment_conf:
+            candidates = range(len(temporal_names))
+        else:
+            candidates = set(index.query(frame_boxes[i]).tolist())
+            for name in similar_names(f.name):
+                candidates.update(by_name.get(name, ()))
+            candidates = sorted(candidates)
+        rows.extend([i] * len(candidates))
+        cols.extend(candidates)
+    return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+
+def assign(similarity, min_assignment_conf):
+    """
+    Solves the assignment of frame nodes (rows) to temporal nodes (columns) globally, maximising the total similarity
+    of pairs with at least min_assignment_conf similarity. Returns a dict from row to column
+    """
+    valid = similarity >= min_assignment_conf
+    # Only rows and columns with at least one valid pair take part in the assignment
+    rows = np.flatnonzero(valid.any(axis=1))
+    cols = np.flatnonzero(valid.any(axis=0))
+    if len(rows) == 0:
+        return {}
+    sub_valid = valid[np.ix_(rows, cols)]
+    # Pairs below the threshold get no weight, so they never displace a valid pair and are dropped afterwards
+    sub_rows, sub_cols = linear_sum_assignment(-np.where(sub_valid, similarity[np.ix_(rows, cols)], 0))
+    return {rows[r]: cols[c] for r, c in zip(sub_rows, sub_cols) if sub_valid[r, c]}
+
+
+@profiler.timed("plot_frame")
+def plot_frame(img_path, export_path, objects):
+    """
+    Draws the boxes and identifiers of objects, a list of (node identifier, SceneObject), over the image
+    """
+    fig, ax = plt.subplots()
+    im = plt.imread(img_path)
+    ax.imshow(im)
+    ax.set_axis_off()
+    for n, o in objects:
+        ax.add_patch(plt.Rectangle((o.xmin, o.ymin), o.xmax - o.xmin, o.ymax - o.ymin,
+                                   fill=False, color="blue", linewidth=2.5))
+        ax.annotate(n, (o.xmin, o.ymin), color="white")
+    plt.savefig(export_path + ".png", dpi=200, bbox_inches="tight")
+    plt.close(fig)
+
+
 def test_temporal_graph():
     fg1 = FrameGraph(1)
     fg1.create_graph("../eval/reltr/glass/0.json")
@@ -310,6 +619,15 @@ def test_temporal_graph_to_frame_plot():
 
     tg.to_frame_plot("../eval/img/airport/4.jpg", "frameplot")
 
+def test_max_inactive():
+    for max_inactive in (0, -1):
+        try:
+            TemporalGraph(max_inactive)
+            print(False)  # Should be True
+        except ValueError:
+            print(True)  # Should be True
+    print(TemporalGraph(1).max_inactive == 1)  # Should be True
+
 if __name__ == "__main__":
     # g = FrameGraph(0)
     # g.test_frame_graph()
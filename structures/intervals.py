@@ -0,0 +1,168 @@
+from bisect import bisect_right
+
+
+class FrameSet:
+    """
+        Set of frame ids stored as sorted, disjoint intervals [first, last] of consecutive ids.
+        An object that is present from frame 3 to 170 takes one interval instead of 168 set entries.
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, frames=()):
+        self.starts = []
+        self.ends = []
+        for frame in sorted(frames):
+            self.add(frame)
+
+    @classmethod
+    def from_intervals(cls, intervals):
+        frame_set = cls()
+        for first, last in intervals:
+            frame_set.starts.append(first)
+            frame_set.ends.append(last)
+        return frame_set
+
+    def add(self, frame):
+        # Frames usually arrive in order, so extending or appending the last interval is the common case
+        if not self.starts or frame > self.ends[-1] + 1:
+            self.starts.append(frame)
+            self.ends.append(frame)
+            return
+        if frame == self.ends[-1] + 1:
+            self.ends[-1] = frame
+            return
+        i = bisect_right(self.starts, frame) - 1
+        if i >= 0 and frame <= self.ends[i]:
+            return
+        if i >= 0 and frame == self.ends[i] + 1:
+            self.ends[i] = frame
+        elif i + 1 < len(self.starts) and frame == self.starts[i + 1] - 1:
+            self.starts[i + 1] = frame
+            return
+        else:
+            self.starts.insert(i + 1, frame)
+            self.ends.insert(i + 1, frame)
+            return
+        # Merge with the following interval if the gap was closed
+        if i + 1 < len(self.starts) and self.ends[i] + 1 == self.starts[i + 1]:
+            self.ends[i] = self.ends.pop(i + 1)
+            self.starts.pop(i + 1)
+
+    def __contains__(self, frame):
+        i = bisect_right(self.starts, frame) - 1
+        return i >= 0 and frame <= self.ends[i]
+
+    def __iter__(self):
+        for first, last in zip(self.starts, self.ends):
+            for frame in range(first, last + 1):
+                yield frame
+
+    def __len__(self):
+        return sum(last - first + 1 for first, last in zip(self.starts, self.ends))
+
+    def intervals(self):
+        return list(zip(self.starts, self.ends))
+
+    def last(self):
+        return self.ends[-1] if self.ends else None
+
+    def __repr__(self):
+        return f"FrameSet({self.intervals()})"
+
+
+class RelationRuns:
+    """
+        Mapping of frame id to relation stored as runs (first, last, relation) of consecutive frames with the same
+        relation. Supports the dict operations the temporal graph uses on edge relations.
+    """
+
+    __slots__ = ("starts", "ends", "relations")
+
+    def __init__(self, relations=None):
+        self.starts = []
+        self.ends = []
+        self.relations = []
+        if relations:
+            for frame in sorted(relations):
+                self[frame] = relations[frame]
+
+    def __setitem__(self, frame, relation):
+        # Frames usually arrive in order, so extending or appending the last run is the common case
+        if not self.starts or frame > self.ends[-1]:
+            if self.starts and frame == self.ends[-1] + 1 and self.relations[-1] == relation:
+                self.ends[-1] = frame
+            else:
+                self.insert_run(len(self.starts), frame, frame, relation)
+            return
+        i = bisect_right(self.starts, frame) - 1
+        if i >= 0 and frame <= self.ends[i]:
+            if self.relations[i] == relation:
+                return
+            # Split the run around frame
+            first, last, old = self.starts[i], self.ends[i], self.relations[i]
+            self.remove_run(i)
+            if frame < last:
+                self.insert_run(i, frame + 1, last, old)
+            self.insert_run(i, frame, frame, relation)
+            if first < frame:
+                self.insert_run(i, first, frame - 1, old)
+                i += 1
+        else:
+            i += 1
+            self.insert_run(i, frame, frame, relation)
+        # Merge with equal neighbouring runs
+        if i + 1 < len(self.starts) and self.ends[i] + 1 == self.starts[i + 1] and \
+                self.relations[i] == self.relations[i + 1]:
+            self.ends[i] = self.ends[i + 1]
+            self.remove_run(i + 1)
+        if i > 0 and self.ends[i - 1] + 1 == self.starts[i] and self.relations[i - 1] == self.relations[i]:
+            self.ends[i - 1] = self.ends[i]
+            self.remove_run(i)
+
+    def insert_run(self, i, first, last, relation):
+        self.starts.insert(i, first)
+        self.ends.insert(i, last)
+        self.relations.insert(i, relation)
+
+    def remove_run(self, i):
+        del self.starts[i], self.ends[i], self.relations[i]
+
+    def __getitem__(self, frame):
+        i = bisect_right(self.starts, frame) - 1
+        if i >= 0 and frame <= self.ends[i]:
+            return self.relations[i]
+        raise KeyError(frame)
+
+    def get(self, frame, default=None):
+        try:
+            return self[frame]
+        except KeyError:
+            return default
+
+    def __contains__(self, frame):
+        i = bisect_right(self.starts, frame) - 1
+        return i >= 0 and frame <= self.ends[i]
+
+    def __iter__(self):
+        for first, last in zip(self.starts, self.ends):
+            for frame in range(first, last + 1):
+                yield frame
+
+    def __len__(self):
+        return sum(last - first + 1 for first, last in zip(self.starts, self.ends))
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(frame, relation) for first, last, relation in self.runs() for frame in range(first, last + 1)]
+
+    def values(self):
+        return [relation for _, relation in self.items()]
+
+    def runs(self):
+        return list(zip(self.starts, self.ends, self.relations))
+
+    def __repr__(self):
+        return f"RelationRuns({self.runs()})"
@@ -0,0 +1,126 @@
+import numpy as np
+
+from structures.store import NodeStore
+from structures.scene import SceneObject
+
+
+class ConstantVelocity:
+    """
+        Per-node motion model that extrapolates box coordinates (xmin, ymin, xmax, ymax) with a constant velocity,
+        estimated as exponentially smoothed displacement per frame between observations.
+        Time is measured in frame positions, so skipped or subsampled frames extend the extrapolation.
+    """
+
+    def __init__(self, smoothing=0.5):
+        self.smoothing = smoothing  # Weight of the newest displacement in the velocity estimate
+
+    def attach(self, store):
+        """
+        Adds the motion state columns to a NodeStore
+        """
+        store.add_column("motion_box", 4)  # Box estimate at the last observation
+        store.add_column("velocity", 4)  # Change of the box coordinates per frame
+        store.add_column("observed", dtype=np.int64)  # Frame position of the last observation
+        store.add_column("observations", dtype=np.int64)
+
+    def start(self, store, n, position):
+        """
+        Initialises the state of new node n from its first box, observed at frame position
+        """
+        row = store.rows[n]
+        store.columns["motion_box"][row] = store.boxes[row]
+        store.columns["velocity"][row] = 0
+        store.columns["observed"][row] = position
+        store.columns["observations"][row] = 1
+
+    def observe(self, store, n, position):
+        """
+        Updates the state of node n with its current box in the store, observed at frame position
+        """
+        row = store.rows[n]
+        dt = position - store.columns["observed"][row]
+        if dt <= 0:
+            store.columns["motion_box"][row] = store.boxes[row]
+            return
+        velocity = (store.boxes[row] - store.columns["motion_box"][row]) / dt
+        if store.columns["observations"][row] > 1:
+            velocity = self.smoothing * velocity + (1 - self.smoothing) * store.columns["velocity"][row]
+        store.columns["velocity"][row] = velocity
+        store.columns["motion_box"][row] = store.boxes[row]
+        store.columns["observed"][row] = position
+        store.columns["observations"][row] += 1
+
+    def predict(self, store, position):
+        """
+        Returns the predicted boxes of all nodes at frame position as N x 4 array, in the order of the store's ids
+        """
+        k = len(store)
+        dt = (position - store.columns["observed"][:k])[:, None]
+        predicted = store.columns["motion_box"][:k] + store.columns["velocity"][:k] * dt
+        # Extrapolated shrinking boxes must not turn inside out
+        predicted[:, 2] = np.maximum(predicted[:, 0], predicted[:, 2])
+        predicted[:, 3] = np.maximum(predicted[:, 1], predicted[:, 3])
+        return predicted
+
+
+class KalmanBox(ConstantVelocity):
+    """
+        Constant velocity Kalman filter over the box coordinates. The four coordinates are filtered independently with
+        the same dynamics and measurement noise, so one 2 x 2 covariance (stored as p00, p01, p11) serves all of them.
+        process_noise is the variance of the acceleration in pixels / frame^2, measurement_noise the variance of a
+        detected coordinate in pixels^2.
+    """
+
+    def __init__(self, process_noise=50.0, measurement_noise=25.0, velocity_variance=400.0):
+        super().__init__()
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.velocity_variance = velocity_variance  # Uncertainty of the unknown velocity of a new node
+
+    def attach(self, store):
+        super().attach(store)
+        store.add_column("covariance", 3)
+
+    def start(self, store, n, position):
+        super().start(store, n, position)
+        store.columns["covariance"][store.rows[n]] = (self.measurement_noise, 0, self.velocity_variance)
+
+    def observe(self, store, n, position):
+        row = store.rows[n]
+        dt = position - store.columns["observed"][row]
+        p00, p01, p11 = store.columns["covariance"][row]
+        q = self.process_noise
+        # Predict state and covariance dt frames ahead
+        x = store.columns["motion_box"][row] + store.columns["velocity"][row] * dt
+        p00, p01, p11 = (p00 + 2 * dt * p01 + dt * dt * p11 + q * dt ** 3 / 3,
+                         p01 + dt * p11 + q * dt ** 2 / 2,
+                         p11 + q * dt)
+        # Correct with the observed box
+        s = p00 + self.measurement_noise
+        k0, k1 = p00 / s, p01 / s
+        residual = store.boxes[row] - x
+        store.columns["motion_box"][row] = x + k0 * residual
+        store.columns["velocity"][row] += k1 * residual
+        store.columns["covariance"][row] = ((1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01)
+        store.columns["observed"][row] = position
+        store.columns["observations"][row] += 1
+
+
+MOTION_MODELS = {"velocity": ConstantVelocity, "kalman": KalmanBox}
+
+
+def test_motion_prediction():
+    for model in MOTION_MODELS.values():
+        store = NodeStore()
+        motion = model()
+        motion.attach(store)
+        store.add("car", SceneObject("car", 0, 0, 10, 10))
+        motion.start(store, "car", 0)
+        for position in range(1, 4):
+            store.update("car", SceneObject("car", 5 * position, 0, 10 + 5 * position, 10))
+            motion.observe(store, "car", position)
+        print(model.__name__, motion.predict(store, 5)[0])  # Should be close to [25, 0, 35, 10]
+
+
+if __name__ == "__main__":
+    test_motion_prediction()
@@ -1,9 +1,15 @@
+import numpy as np
+
+
 class SceneTriple():
 
+    __slots__ = ("subject", "predicate", "object", "_hash")
+
     def __init__(self, subject_name, sxmin, symin, sxmax, symax, predicate, object_name, oxmin, oymin, oxmax, oymax):
         self.subject = SceneObject(subject_name, sxmin, symin, sxmax, symax)
         self.predicate = predicate
         self.object = SceneObject(object_name, oxmin, oymin, oxmax, oymax)
+        self._hash = None
 
     @classmethod
     def from_desc(cls, subject_name, predicate, object_name):
@@ -13,9 +19,23 @@ class SceneTriple():
             object_name, 0, 0, 0, 0
         )
 
+    @classmethod
+    def from_objects(cls, subject, predicate, object):
+        """
+        Creates triple from existing SceneObjects
+        """
+        triple = cls.__new__(cls)
+        triple.subject = subject
+        triple.predicate = predicate
+        triple.object = object
+        triple._hash = None
+        return triple
+
     def __hash__(self):
         """Should only check on S, P, O, but not other variables"""
-        return hash((self.subject, self.predicate, self.object))
+        if self._hash is None:  # Computed on first use
+            self._hash = hash((self.subject, self.predicate, self.object))
+        return self._hash
 
     def __str__(self):
         return f"{self.subject} {self.predicate} {self.object}"
@@ -23,12 +43,17 @@ class SceneTriple():
 
 class SceneObject:
 
+    # Objects are not changed after creation, so area and hash are only computed once
+    __slots__ = ("name", "xmin", "ymin", "xmax", "ymax", "area", "_hash")
+
     def __init__(self, name, xmin, ymin, xmax, ymax):
         self.name = name
         self.xmin = xmin
         self.ymin = ymin
         self.xmax = xmax
         self.ymax = ymax
+        self.area = (xmax - xmin) * (ymax - ymin)
+        self._hash = None
 
     @classmethod
     def from_centre(cls, name, centre_x, centre_y, w, h):
@@ -48,7 +73,9 @@ class SceneObject:
 
     def __hash__(self):
         """Should only check on S, P, O, but not other variables"""
-        return hash((self.name, self.xmin, self.ymin, self.xmax, self.ymax))
+        if self._hash is None:  # Computed on first use
+            self._hash = hash((self.name, self.xmin, self.ymin, self.xmax, self.ymax))
+        return self._hash
 
     def __str__(self):
         return f"{self.name}"
@@ -71,26 +98,126 @@ class SceneObject:
 
     def box_similarity(self, other):
         """
-        Returns fraction of overlap with other to own box. 1 if perfect overlap, 0 if no overlap
+        Returns fraction of overlap with other to the larger box. 1 if perfect overlap, 0 if no overlap or no area
         """
-        a_self = (self.xmax - self.xmin) * (self.ymax - self.ymin)
-        a_other = (other.xmax - other.xmin) * (other.ymax - other.ymin)
+        a_self = self.area
+        a_other = other.area
         overlap = max(min(self.xmax, other.xmax) - max(self.xmin, other.xmin), 0) * \
                   max(min(self.ymax, other.ymax) - max(self.ymin, other.ymin), 0)
 
         if a_self > a_other:
             return overlap / a_self
-        else:
+        elif a_other > 0:
             return overlap / a_other
+        else:
+            return 0
 
     def box_overlap(self, other):
         """
-        Returns fraction of overlap with other to own box. 1 if perfect overlap, 0 if no overlap
+        Returns fraction of overlap with other to own box. 1 if perfect overlap, 0 if no overlap or no own area
         """
-        a_self = (self.xmax - self.xmin) * (self.ymax - self.ymin)
+        a_self = self.area
         overlap = max(min(self.xmax, other.xmax) - max(self.xmin, other.xmin), 0) * \
                   max(min(self.ymax, other.ymax) - max(self.ymin, other.ymin), 0)
-        return overlap /a_self
+        return overlap / a_self if a_self > 0 else 0
+
+class Vocabulary:
+    """
+        Maps names to consecutive integer ids, shared by the scene graphs of a sequence so ids are comparable
+    """
+
+    __slots__ = ("ids", "names")
+
+    def __init__(self, names=()):
+        self.ids = {}
+        self.names = []
+        for name in names:
+            self.id(name)
+
+    def id(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        return self.ids[name]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class SceneGraphArrays:
+    """
+        Triples of one scene graph as typed arrays: subject, predicate and object ids (int32) into the name and
+        predicate vocabularies and the boxes (xmin, ymin, xmax, ymax) of subjects and objects as N x 4 matrices.
+        SceneObjects are only created on request.
+    """
+
+    __slots__ = ("subjects", "predicates", "objects", "subject_boxes", "object_boxes", "names", "predicate_names")
+
+    def __init__(self, subjects, predicates, objects, subject_boxes, object_boxes, names, predicate_names):
+        self.subjects = subjects
+        self.predicates = predicates
+        self.objects = objects
+        self.subject_boxes = subject_boxes
+        self.object_boxes = object_boxes
+        self.names = names
+        self.predicate_names = predicate_names
+
+    @classmethod
+    def from_json(cls, triples, names=None, predicate_names=None, dtype=np.float32):
+        """
+        Converts triples in the RelTR JSON format in one pass per column
+        """
+        names = Vocabulary() if names is None else names
+        predicate_names = Vocabulary() if predicate_names is None else predicate_names
+        name_ids, predicate_ids = names.ids, predicate_names.ids
+        entities = []
+        predicates = []
+        coordinates = []
+        for t in triples:
+            sub, pred, obj = t["subject"], t["predicate"]["id"], t["object"]
+            entities.append(name_ids[sub["id"]] if sub["id"] in name_ids else names.id(sub["id"]))
+            entities.append(name_ids[obj["id"]] if obj["id"] in name_ids else names.id(obj["id"]))
+            predicates.append(predicate_ids[pred] if pred in predicate_ids else predicate_names.id(pred))
+            coordinates += (sub["xmin"], sub["ymin"], sub["xmax"], sub["ymax"],
+                            obj["xmin"], obj["ymin"], obj["xmax"], obj["ymax"])
+        entities = np.array(entities, dtype=np.int32).reshape(-1, 2)
+        boxes = np.array(coordinates, dtype=dtype).reshape(-1, 2, 4)
+        return cls(entities[:, 0], np.array(predicates, dtype=np.int32), entities[:, 1], boxes[:, 0], boxes[:, 1],
+                   names, predicate_names)
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def entity_ids(self):
+        """
+        Returns the name ids of subjects and objects interleaved, subject and object of triple t are at 2t and 2t + 1
+        """
+        return np.stack([self.subjects, self.objects], axis=1).reshape(-1)
+
+    def entity_boxes(self):
+        """
+        Returns the boxes of subjects and objects interleaved as 2N x 4 matrix
+        """
+        return np.stack([self.subject_boxes, self.object_boxes], axis=1).reshape(-1, 4)
+
+    def scene_object(self, k):
+        """
+        Returns the k-th entity (subject of triple k // 2 or its object) as SceneObject
+        """
+        name_ids, box_array = (self.subjects, self.subject_boxes) if k % 2 == 0 else (self.objects, self.object_boxes)
+        xmin, ymin, xmax, ymax = box_array[k // 2].tolist()
+        return SceneObject(self.names.names[name_ids[k // 2]], xmin, ymin, xmax, ymax)
+
+    def predicate(self, t):
+        return self.predicate_names.names[self.predicates[t]]
+
+    def triples(self):
+        """
+        Returns all triples as SceneTriples
+        """
+        return [SceneTriple.from_objects(self.scene_object(2 * t), self.predicate(t), self.scene_object(2 * t + 1))
+                for t in range(len(self))]
+
 
 def test_approximately_same():
     phoneA = SceneObject("phone", 399.01727294921875, 159.24984741210938, 462.11737060546875, 212.27130126953125)
@@ -0,0 +1,141 @@
+import uuid
+
+import numpy as np
+
+from structures.graph import FrameGraph, TemporalGraph, assign
+from structures.intervals import FrameSet, RelationRuns
+from structures.motion import MOTION_MODELS
+from utils.sequences import open_sequence
+
+
+def build_segment(graph_path, first_frame, last_frame, alpha, min_assignment_conf, max_inactive=None, compact=False,
+                  motion=None):
+    """
+    Builds the temporal graph of the frames first_frame to last_frame (exclusive) of the scene graphs in graph_path.
+    Frame positions are counted from the start of the whole sequence, so last seen frames and motion states of
+    different segments are comparable. Returns the temporal graph and the node creations of the segment as list of
+    (frame graph of the created nodes, their node identifiers), in frame order
+    """
+    tg = TemporalGraph(max_inactive, compact, MOTION_MODELS[motion]() if motion else None)
+    tg.frame_ids = list(range(first_frame))
+    created = []
+    known = set()
+    sequence = open_sequence(graph_path)
+    for sg_count in range(first_frame, last_frame):
+        fg = FrameGraph(sg_count)
+        fg.create_graph_from_arrays(sequence[sg_count])
+        f2t = tg.insert_framegraph(fg, alpha, min_assignment_conf)
+        new = [f for f in fg.g.nodes() if f2t[f] not in known]
+        if new:
+            # Only the created nodes and their neighbour names are needed to match them against another segment
+            creation = FrameGraph(sg_count)
+            for f in new:
+                creation.g.add_node(f)
+                creation.neighbours[f] = fg.neighbours[f]
+            created.append((creation, [f2t[f] for f in new]))
+            known.update(f2t[f] for f in new)
+    return tg, created
+
+
+def match_boundary(tg, created, alpha, min_assignment_conf, candidates, taken):
+    """
+    Matches the nodes created in a later segment against the candidates among the nodes live at the end of an earlier
+    segment's temporal graph tg, frame by frame as inserting the frames into tg would have done. Candidates that are
+    matched or retired by then drop out, created nodes in taken are skipped.
+    Returns a dict from node of the earlier segment to node of the later segment
+    """
+    temporal_nodes = list(tg.store.ids)
+    end = len(tg.frame_ids) - 1
+    last_seen = np.array([tg.g.nodes[n]["last_seen"] for n in temporal_nodes])
+    available = np.array([n in candidates for n in temporal_nodes], dtype=bool)
+    matched = {}
+    for framegraph, nodes in created:
+        position = end + framegraph.frame_id - tg.frame_ids[-1]
+        if tg.max_inactive is not None:
+            available &= position - last_seen < tg.max_inactive
+        if not available.any():
+            break
+        tg.frame_ids.append(framegraph.frame_id)  # Predicts motion up to the frame
+        frame_nodes = list(framegraph.g.nodes())
+        similarity = tg.similarity_matrix(framegraph, frame_nodes, temporal_nodes, alpha, min_assignment_conf)
+        tg.frame_ids.pop()
+        similarity[:, ~available] = 0
+        similarity[[i for i, n in enumerate(nodes) if n in taken], :] = 0
+        for i, j in assign(similarity, min_assignment_conf).items():
+            matched[temporal_nodes[j]] = nodes[i]
+            available[j] = False
+    return matched
+
+
+def stitch(segments, alpha, min_assignment_conf):
+    """
+    Joins the temporal graphs of consecutive segments, a list of build_segment results, into one temporal graph.
+    Nodes matched at a segment boundary become one node named after its first occurrence. Nodes that are live at the
+    end of the last segment stay live, all other nodes and their edges are archived as if they had been retired
+    """
+    # Identify each node by (segment, node identifier), matched nodes point to their node in an earlier segment.
+    # Nodes live at the end of a segment stay candidates for all later segments until they are matched
+    parent = {}
+    unmatched = []  # Per segment, the nodes live at its end that are not matched yet
+    for k in range(1, len(segments)):
+        unmatched.append(set(segments[k - 1][0].store.ids))
+        _, created = segments[k]
+        taken = set()
+        for j in range(k - 1, -1, -1):  # Most recent segments first
+            if not unmatched[j]:
+                continue
+            for a, b in match_boundary(segments[j][0], created, alpha, min_assignment_conf, unmatched[j],
+                                       taken).items():
+                parent[k, b] = (j, a)
+                unmatched[j].discard(a)
+                taken.add(b)
+
+    def root(key):
+        while key in parent:
+            key = parent[key]
+        return key
+
+    names = {}  # Maps root to the identifier of the stitched node
+    taken = set()
+    nodes = {}  # Maps stitched node to {"content": latest SceneObject, "frames": set}
+    edges = {}  # Maps stitched (n1, n2) to {frame: relation}
+    for k, (tg, _) in enumerate(segments):
+        g = tg.export_graph()
+        ids = {}
+        for n in g.nodes:
+            r = root((k, n))
+            if r not in names:
+                name = r[1]
+                if name in taken:  # Identifiers of different segments collide
+                    name = f"{name.rsplit('_', 1)[0]}_{str(uuid.uuid4())[0:4]}"
+                names[r] = name
+                taken.add(name)
+            ids[n] = names[r]
+            node = nodes.setdefault(ids[n], {"frames": set()})
+            node["content"] = g.nodes[n]["content"]
+            node["frames"].update(g.nodes[n]["frames"])
+        for n1, n2 in g.edges:
+            edges.setdefault((ids[n1], ids[n2]), {}).update(g[n1][n2]["relations"].items())
+
+    last, _ = segments[-1]
+    stitched = TemporalGraph(last.max_inactive, last.compact, last.motion)
+    stitched.frame_ids = list(last.frame_ids)
+    live = {names[root((len(segments) - 1, n))]: n for n in last.store.ids}
+    for n, node in nodes.items():
+        if n in live:
+            stitched.add_node(n, node["content"])
+            stitched.g.nodes[n]["frames"] = FrameSet(node["frames"]) if stitched.compact else node["frames"]
+            stitched.g.nodes[n]["last_seen"] = last.g.nodes[live[n]]["last_seen"]
+            # Keep the motion state of the last segment
+            row, last_row = stitched.store.rows[n], last.store.rows[live[n]]
+            for column, values in last.store.columns.items():
+                stitched.store.columns[column][row] = values[last_row]
+        else:
+            stitched.archived_nodes[n] = {"content": node["content"], "frames": FrameSet(node["frames"])}
+    for (n1, n2), relations in edges.items():
+        if n1 in live and n2 in live:
+            stitched.g.add_edge(n1, n2, relations=RelationRuns(relations) if stitched.compact else relations)
+            stitched.g.nodes[n1]["neighbours"][stitched.store.name(n2)] += 1
+        else:
+            stitched.archived_edges[n1, n2] = RelationRuns(relations)
+    return stitched
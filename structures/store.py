@@ -0,0 +1,88 @@
+import numpy as np
+
+from structures.scene import SceneObject
+
+
+class NodeStore:
+    """
+        Struct-of-arrays storage of the latest box and integer-coded label of every live temporal graph node.
+        Rows stay dense: removing a node moves the last row into its place.
+    """
+
+    def __init__(self, capacity=64):
+        self.ids = []  # Maps row to node identifier
+        self.rows = {}  # Maps node identifier to row
+        self.boxes = np.zeros((capacity, 4))
+        self.labels = np.zeros(capacity, dtype=np.int32)
+        self.label_names = []  # Maps label to name
+        self.label_ids = {}  # Maps name to label
+        self.columns = {}  # Additional per-node arrays, e.g. motion state, that are grown and moved with the rows
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, n):
+        return n in self.rows
+
+    def add_column(self, name, width=None, dtype=float):
+        """
+        Adds a per-node array of shape (capacity,) or (capacity, width), initialised with zeros
+        """
+        shape = (len(self.boxes),) if width is None else (len(self.boxes), width)
+        self.columns[name] = np.zeros(shape, dtype=dtype)
+        return self.columns[name]
+
+    def label(self, name):
+        if name not in self.label_ids:
+            self.label_ids[name] = len(self.label_names)
+            self.label_names.append(name)
+        return self.label_ids[name]
+
+    def add(self, n, content):
+        if len(self.ids) == len(self.boxes):
+            self.boxes = np.concatenate([self.boxes, np.zeros_like(self.boxes)])
+            self.labels = np.concatenate([self.labels, np.zeros_like(self.labels)])
+            for name, column in self.columns.items():
+                self.columns[name] = np.concatenate([column, np.zeros_like(column)])
+        self.rows[n] = len(self.ids)
+        self.ids.append(n)
+        self.update(n, content)
+
+    def update(self, n, content):
+        row = self.rows[n]
+        self.boxes[row] = (content.xmin, content.ymin, content.xmax, content.ymax)
+        self.labels[row] = self.label(content.name)
+
+    def remove(self, n):
+        row = self.rows.pop(n)
+        last_id = self.ids.pop()
+        if last_id != n:
+            last = len(self.ids)
+            self.ids[row] = last_id
+            self.rows[last_id] = row
+            self.boxes[row] = self.boxes[last]
+            self.labels[row] = self.labels[last]
+            for column in self.columns.values():
+                column[row] = column[last]
+
+    def active_boxes(self):
+        """
+        Returns the boxes of all nodes as N x 4 array, in the order of ids
+        """
+        return self.boxes[:len(self.ids)]
+
+    def names(self):
+        """
+        Returns the names of all nodes, in the order of ids
+        """
+        return [self.label_names[label] for label in self.labels[:len(self.ids)]]
+
+    def name(self, n):
+        return self.label_names[self.labels[self.rows[n]]]
+
+    def content(self, n):
+        """
+        Returns the latest SceneObject of node n
+        """
+        xmin, ymin, xmax, ymax = self.boxes[self.rows[n]].tolist()
+        return SceneObject(self.name(n), xmin, ymin, xmax, ymax)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from utils.profiler import profiler
+
+INDEX_NAME = "index.json"
+SAVE_EVERY = 32  # Number of new entries after which the index is written
+
+
+class SceneGraphCache:
+    """
+        Persistent cache of generated scene graphs, keyed by image content, model checkpoint and generator settings.
+        Entries are stored as one json file per key and evicted least recently used first when max_bytes is exceeded.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.entries = self.load_index()  # Maps key to entry size in bytes, least recently used first
+        self.bytes = sum(self.entries.values())
+        self.unsaved = 0  # Entries added since the index was written
+        self.evict()
+
+    def load_index(self):
+        """
+        Reads the LRU order from the index file. Entry files that are not in the index, e.g. written by a run that
+        was interrupted before it saved the index, are adopted as least recently used, so they count towards max_bytes
+        """
+        index_path = os.path.join(self.cache_dir, INDEX_NAME)
+        index = []
+        if os.path.isfile(index_path):
+            with open(index_path, "r") as file:
+                index = json.load(file)
+                file.close()
+        files = {f[:-5] for f in os.listdir(self.cache_dir) if f.endswith(".json") and f != INDEX_NAME}
+        indexed = {key for key, _ in index}
+        orphans = sorted((key for key in files if key not in indexed),
+                         key=lambda key: os.path.getmtime(self.entry_path(key)))
+        entries = OrderedDict((key, os.path.getsize(self.entry_path(key))) for key in orphans)
+        entries.update((key, size) for key, size in index if key in files)
+        return entries
+
+    def save_index(self):
+        with open(os.path.join(self.cache_dir, INDEX_NAME), "w") as file:
+            json.dump(list(self.entries.items()), file)
+            file.close()
+        self.unsaved = 0
+
+    def close(self):
+        """
+        Writes the index if entries were added since it was last written
+        """
+        if self.unsaved:
+            self.save_index()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key):
+        """
+        Returns the cached triples for key or None
+        """
+        if key not in self.entries:
+            self.misses += 1
+            profiler.count("cache_misses")
+            return None
+        with open(self.entry_path(key), "r") as file:
+            triples = json.load(file)
+            file.close()
+        self.entries.move_to_end(key)
+        self.hits += 1
+        profiler.count("cache_hits")
+        return triples
+
+    def put(self, key, triples):
+        data = json.dumps(triples)
+        with open(self.entry_path(key), "w") as file:
+            file.write(data)
+            file.close()
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)
+        self.entries[key] = len(data)
+        self.bytes += len(data)
+        self.evict()
+        self.unsaved += 1
+        if self.unsaved >= SAVE_EVERY:
+            self.save_index()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits into max_bytes
+        """
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            os.remove(self.entry_path(key))
+            self.bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries), "bytes": self.bytes}
+
+    def report(self):
+        stats = self.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups if lookups > 0 else 0
+        print(f"Scene graph cache: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.0%} hit rate), "
+              f"{stats['evictions']} evictions, {stats['entries']} entries, {stats['bytes']} bytes")
+
+
+def image_key(img_path, model_key):
+    """
+    Content hash of an image combined with the identity of the model that creates its scene graph
+    """
+    h = hashlib.sha1()
+    with open(img_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            h.update(chunk)
+        file.close()
+    h.update(model_key.encode("utf-8"))
+    return h.hexdigest()
+
+
+def checkpoint_key(checkpoint, *settings):
+    """
+    Identifies a checkpoint by path, size and modification time (hashing the weights would take longer than inference)
+    """
+    if os.path.isfile(checkpoint):
+        stat = os.stat(checkpoint)
+        identity = [os.path.abspath(checkpoint), stat.st_size, int(stat.st_mtime)]
+    else:
+        identity = [os.path.abspath(checkpoint)]
+    return json.dumps(identity + list(settings))
@@ -0,0 +1,48 @@
+from PIL import Image
+
+HASH_SIZE = 8
+
+
+class DuplicateFrameFilter:
+    """
+        Detects near-duplicate frames with a perceptual difference hash (dHash).
+        A frame is a duplicate if its hash differs in at most threshold bits from the last frame that was not a duplicate,
+        comparing against the last processed frame keeps slow drifts from being skipped indefinitely.
+    """
+
+    def __init__(self, threshold, hash_size=HASH_SIZE):
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.last_hash = None
+        self.skipped = 0
+
+    def is_duplicate(self, img_path):
+        h = difference_hash(img_path, self.hash_size)
+        if self.last_hash is not None and hamming_distance(h, self.last_hash) <= self.threshold:
+            self.skipped += 1
+            return True
+        self.last_hash = h
+        return False
+
+    def reset(self):
+        self.last_hash = None
+
+
+def difference_hash(img_path, hash_size=HASH_SIZE):
+    """
+    Returns a hash_size * hash_size bit integer, each bit tells whether a pixel of the downscaled grayscale image
+    is brighter than its right neighbour
+    """
+    im = Image.open(img_path).convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(im.getdata())
+    h = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            h = (h << 1) | (left > right)
+    return h
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
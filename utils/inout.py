@@ -1,27 +1,54 @@
 import json
 
+import numpy as np
+
 from structures.scene import *
 
 def get_triples(graph_path):
     """
     Complete import of a graph created with RelTR
     """
-    triples_read = []
+    triples_read = load_triple_arrays(graph_path, dtype=float).triples()
+    print(f"Loaded {len(triples_read)} objects from {graph_path}")
+    return triples_read
+    
+def load_triple_arrays(graph_path, names=None, predicate_names=None, dtype=np.float32):
+    """
+    Loads a graph created with RelTR into typed arrays (SceneGraphArrays), names and predicate_names are optional
+    Vocabularies shared between the graphs of a sequence
+    """
     with open(graph_path, "r") as file:
         triples = json.load(file)
         file.close()
+    return SceneGraphArrays.from_json(triples, names, predicate_names, dtype)
+
+def get_yolo_frames(yolo_path):
+    """
+    Import of detections in the YOLO (darknet) JSON format, returns (frame_id, filename, objects) for every frame.
+    Boxes are relative to the image size
+    """
+    with open(yolo_path, "r") as file:
+        frames = json.load(file)
+        file.close()
+
+    frames_read = []
+    for frame in frames:
+        objects = []
+        for detection in frame["objects"]:
+            box = detection["relative_coordinates"]
+            objects.append(SceneObject.from_centre(detection["name"], box["center_x"], box["center_y"],
+                                                   box["width"], box["height"]))
+        frames_read.append((frame["frame_id"], frame["filename"], objects))
+    return frames_read
+
+def get_objects(yolo_path, frame_index=0):
+    """
+    Import of the detected objects of one frame (by default the first) of a YOLO JSON file
+    """
+    _, _, objects = get_yolo_frames(yolo_path)[frame_index]
+    print(f"Loaded {len(objects)} objects from {yolo_path}")
+    return objects
 
-    for triple_dict in triples:
-        subject = triple_dict["subject"]
-        predicate = triple_dict["predicate"]
-        object = triple_dict["object"]
-        triple = SceneTriple(subject["id"], subject["xmin"], subject["ymin"], subject["xmax"], subject["ymax"],
-                             predicate["id"],
-                             object["id"], object["xmin"], object["ymin"], object["xmax"], object["ymax"])
-        triples_read.append(triple)
-    print(f"Loaded {len(triples_read)} objects from {graph_path}")
-    return triples_read
-    
 def clean_img_list(l):
     l1 = []
     for el in l:
@@ -0,0 +1,44 @@
+import queue
+import threading
+
+QUEUE_SIZE = 8
+
+_END = object()
+
+
+class Stage(threading.Thread):
+    """
+        Runs one pipeline stage in a background thread and hands its results to the next stage through a bounded queue.
+        A full queue blocks the stage until the consumer catches up (backpressure).
+    """
+
+    def __init__(self, produce, maxsize=QUEUE_SIZE):
+        """
+        produce is a callable returning an iterable, typically consuming the previous stage
+        """
+        super().__init__(daemon=True)
+        self.produce = produce
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            for item in self.produce():
+                self.queue.put(item)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.queue.put(_END)
+
+    def __iter__(self):
+        """
+        Yields the results in order as they become available, re-raises an error of the stage in the consumer
+        """
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield item
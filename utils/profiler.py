@@ -0,0 +1,112 @@
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, float("inf"))
+
+
+class Profiler:
+    """
+        Collects per-stage latency histograms and event counters of the graphene pipeline.
+        Disabled by default, then timers and counters cost a single attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, stage):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """
+        Decorator that times every call of a function as stage
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = {"count": 0, "sum": 0.0, "min": seconds, "max": seconds,
+                                      "buckets": [0] * len(BUCKETS)}
+            s = self.stages[stage]
+            s["count"] += 1
+            s["sum"] += seconds
+            s["min"] = min(s["min"], seconds)
+            s["max"] = max(s["max"], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    s["buckets"][i] += 1
+                    break
+
+    def count(self, counter, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+
+    def report(self):
+        """
+        Returns latency statistics per stage and all counters as dict
+        """
+        with self.lock:
+            stages = {}
+            for stage, s in self.stages.items():
+                stages[stage] = {"count": s["count"], "total_seconds": s["sum"], "mean_seconds": s["sum"] / s["count"],
+                                 "min_seconds": s["min"], "max_seconds": s["max"],
+                                 "histogram": {str(bound): n for bound, n in zip(BUCKETS, s["buckets"])}}
+            return {"stages": stages, "counters": dict(self.counters)}
+
+    def to_json(self, export_path):
+        with open(export_path, "w") as file:
+            json.dump(self.report(), file, indent=2)
+            file.close()
+
+    def to_prometheus(self, export_path):
+        """
+        Writes the stage latencies as cumulative histogram and the counters in the Prometheus text format
+        """
+        lines = ["# TYPE graphene_stage_seconds histogram"]
+        with self.lock:
+            for stage, s in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, n in zip(BUCKETS, s["buckets"]):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f'graphene_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'graphene_stage_seconds_sum{{stage="{stage}"}} {s["sum"]}')
+                lines.append(f'graphene_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+            for counter, n in sorted(self.counters.items()):
+                lines.append(f"# TYPE graphene_{counter}_total counter")
+                lines.append(f"graphene_{counter}_total {n}")
+        with open(export_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+            file.close()
+
+
+# Shared by all pipeline stages, enabled with graphene's --profile
+profiler = Profiler()
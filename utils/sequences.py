@@ -0,0 +1,161 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from structures.scene import SceneGraphArrays, Vocabulary
+from utils import inout
+
+usage_hint = """
+    Description: Packs a directory of scene graphs (.json, one per frame) into one columnar file per sequence.
+
+    Usage: python -m utils.sequences <graph_path> <columnar_file>
+
+    Examples:
+    [1]: $ python -m utils.sequences eval/reltr/airport eval/reltr/airport.sgc
+         $ python graphene.py --graph_path eval/reltr/airport.sgc
+"""
+
+MAGIC = b"SGCOLS01"
+ALIGNMENT = 64
+# Column name, dtype and number of values per triple (None for the frame offset table).
+# RelTR boxes are float32, so storing them as float32 is lossless
+COLUMNS = (("offsets", "<i8", None),
+           ("subjects", "<i4", 1),
+           ("predicates", "<i4", 1),
+           ("objects", "<i4", 1),
+           ("subject_boxes", "<f4", 4),
+           ("object_boxes", "<f4", 4))
+
+
+class JsonSequence:
+    """
+        Scene graphs of a sequence stored as one RelTR JSON file per frame in a directory, loaded on access
+    """
+
+    def __init__(self, graph_path, dtype=float):
+        self.graph_path = graph_path
+        self.dtype = dtype
+        self.frame_names = inout.clean_json_list(sorted(os.listdir(graph_path)))
+        self.names = Vocabulary()
+        self.predicate_names = Vocabulary()
+
+    def __len__(self):
+        return len(self.frame_names)
+
+    def __getitem__(self, i):
+        return inout.load_triple_arrays(os.path.join(self.graph_path, self.frame_names[i]), self.names,
+                                        self.predicate_names, self.dtype)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ColumnarSequence:
+    """
+        Scene graphs of a sequence in one columnar file: a JSON header with the name and predicate vocabularies and the
+        location of each column, followed by the columns as raw little-endian arrays. The triples of frame i are rows
+        offsets[i] to offsets[i + 1] of every column. Columns are memory-mapped, frames are read from disk on access
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a columnar scene graph file")
+            header_size = int(np.frombuffer(file.read(8), dtype="<u8")[0])
+            header = json.loads(file.read(header_size).decode("utf-8"))
+            file.close()
+        self.frame_names = header["frame_names"]
+        self.names = Vocabulary(header["names"])
+        self.predicate_names = Vocabulary(header["predicates"])
+        self.columns = {}
+        for name, column in header["columns"].items():
+            shape = tuple(column["shape"])
+            if shape[0] == 0:  # Empty arrays can not be memory-mapped
+                self.columns[name] = np.zeros(shape, dtype=column["dtype"])
+            else:
+                self.columns[name] = np.memmap(path, dtype=column["dtype"], mode="r", offset=column["offset"],
+                                               shape=shape)
+
+    def __len__(self):
+        return len(self.frame_names)
+
+    def __getitem__(self, i):
+        start, stop = self.columns["offsets"][i:i + 2].tolist()
+        c = self.columns
+        return SceneGraphArrays(c["subjects"][start:stop], c["predicates"][start:stop], c["objects"][start:stop],
+                                c["subject_boxes"][start:stop], c["object_boxes"][start:stop],
+                                self.names, self.predicate_names)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def open_sequence(graph_path):
+    """
+    Opens the scene graphs of --graph_path, either a directory of JSON files or a columnar file
+    """
+    if os.path.isfile(graph_path):
+        return ColumnarSequence(graph_path)
+    return JsonSequence(graph_path)
+
+
+def write_columnar(path, frames, frame_names, names, predicate_names):
+    """
+    Writes frames, a list of SceneGraphArrays whose ids refer to the Vocabularies names and predicate_names,
+    as columnar file
+    """
+    offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(frame) for frame in frames])
+    data = {"offsets": offsets}
+    for name, dtype, width in COLUMNS[1:]:
+        parts = [getattr(frame, name) for frame in frames]
+        shape = (int(offsets[-1]),) if width == 1 else (int(offsets[-1]), width)
+        data[name] = np.concatenate(parts).astype(dtype) if parts else np.zeros(shape, dtype=dtype)
+
+    # The header stores the column offsets, which depend on the header size: reserve room for them first
+    columns = {name: {"dtype": dtype, "shape": list(data[name].shape), "offset": 0} for name, dtype, _ in COLUMNS}
+    header = {"frame_names": list(frame_names), "names": names.names, "predicates": predicate_names.names,
+              "columns": columns}
+    reserved = len(json.dumps(header).encode("utf-8")) + 32 * len(COLUMNS)
+    position = aligned(len(MAGIC) + 8 + reserved)
+    for name, _, _ in COLUMNS:
+        columns[name]["offset"] = position
+        position = aligned(position + data[name].nbytes)
+    encoded = json.dumps(header).encode("utf-8").ljust(reserved)
+
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        file.write(np.array([len(encoded)], dtype="<u8").tobytes())
+        file.write(encoded)
+        for name, dtype, _ in COLUMNS:
+            file.write(b"\0" * (columns[name]["offset"] - file.tell()))
+            file.write(np.ascontiguousarray(data[name], dtype=dtype).tobytes())
+        file.close()
+
+
+def aligned(position):
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def pack(graph_path, path):
+    """
+    Packs a directory of scene graphs (.json) into a columnar file
+    """
+    sequence = JsonSequence(graph_path)
+    frames = list(sequence)
+    write_columnar(path, frames, sequence.frame_names, sequence.names, sequence.predicate_names)
+    size = sum(os.path.getsize(os.path.join(graph_path, f)) for f in sequence.frame_names)
+    print(f"Packed {len(frames)} frames with {sum(len(f) for f in frames)} triples from {size} to "
+          f"{os.path.getsize(path)} bytes")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] in ("-h", "--help"):
+        print(usage_hint)
+        exit(0 if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help") else 1)
+    pack(sys.argv[1], sys.argv[2])
@@ -0,0 +1,108 @@
+import os
+import re
+
+SYNC_EVERY = 10
+HEADER = re.compile(rb"In frame (\d+):\n")
+
+
+class IncrementalTextExport:
+    """
+        Append-only graph2text export for online mode: every frame adds its own section ("In frame N:" and its
+        relations) at the end of the file instead of rewriting the whole temporal graph, so readers can tail the file.
+        Sections are flushed immediately and fsynced every sync_every frames. An index file next to the export
+        (<export_path>.idx) lists frame, start and end offset of every synced section, so an interrupted session can
+        be reopened with resume=True: the export is cut back to the last indexed section and continues after it.
+    """
+
+    def __init__(self, export_path, sync_every=SYNC_EVERY, resume=False):
+        self.export_path = export_path
+        self.index_path = export_path + ".idx"
+        self.sync_every = sync_every
+        resume = resume and os.path.isfile(export_path)
+        self.index = []
+        if resume:
+            size = os.path.getsize(export_path)
+            # Entries past the end of the export are stale. Without a usable index (e.g. for an export written by
+            # to_text) the sections are found by scanning the export, so resuming never discards synced text
+            self.index = [entry for entry in load_index(self.index_path) if entry[2] <= size]
+            if not self.index and size:
+                self.index = scan_index(export_path)
+        end = self.index[-1][2] if self.index else 0
+        self.file = open(export_path, "r+b" if resume else "wb")
+        self.file.truncate(end)  # Drops sections written after the last sync
+        self.file.seek(end)
+        self.index_file = open(self.index_path, "w")
+        self.index_file.writelines(f"{frame} {start} {stop}\n" for frame, start, stop in self.index)
+        self.pending = 0
+
+    def next_frame(self):
+        """
+        Returns the frame number following the last exported frame
+        """
+        return self.index[-1][0] + 1 if self.index else 0
+
+    def append(self, frame, stories):
+        """
+        Appends the section of frame with stories, the lines of TemporalGraph.to_text. Frames without stories
+        have no section, as in to_text
+        """
+        if not stories:
+            return
+        start = self.file.tell()
+        self.file.write((f"In frame {frame}:\n" + "".join(stories)).encode("utf-8"))
+        self.file.flush()
+        self.index.append((frame, start, self.file.tell()))
+        self.index_file.write(f"{frame} {start} {self.file.tell()}\n")
+        self.pending += 1
+        if self.pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        # The export is synced before the index, so the index never points past synced text
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+        self.index_file.close()
+
+
+def load_index(index_path):
+    """
+    Returns the (frame, start offset, end offset) entries of an export index, ignoring an incomplete last line
+    """
+    index = []
+    if not os.path.isfile(index_path):
+        return index
+    with open(index_path, "r") as file:
+        for line in file:
+            parts = line.split()
+            if not line.endswith("\n") or len(parts) != 3:
+                break
+            index.append(tuple(int(part) for part in parts))
+        file.close()
+    return index
+
+
+def scan_index(export_path):
+    """
+    Returns the (frame, start offset, end offset) entries of the sections of an export, found by their headers
+    """
+    index = []
+    offset = 0
+    with open(export_path, "rb") as file:
+        for line in file:
+            header = HEADER.match(line)
+            if header:
+                if index:
+                    index[-1] = index[-1][:2] + (offset,)
+                index.append((int(header.group(1)), offset, None))
+            offset += len(line)
+        file.close()
+    if index:
+        index[-1] = index[-1][:2] + (offset,)
+    return index